@@ -1,14 +1,142 @@
-class Bucket:
-    def __init__(self, capacity=4):
-        self.points = []
+import numpy as np
+
+
+class BucketArray:
+    """ Conjunto de buckets de capacidad fija guardados en arreglos NumPy compartidos.
+
+    El bucket `b` es la fila b de `xs`, `ys` (float64) e `ids` (int64, id de fila
+    del dato, p. ej. la posición del POI en una tabla externa); `counts[b]` dice
+    cuántas columnas están ocupadas. Un punto cuesta 24 bytes sin objetos Python
+    por punto ni por bucket, y los barridos se hacen vectorizados sobre varias
+    filas a la vez.
+    Los puntos que no caben en un bucket que no se puede dividir (coordenadas
+    idénticas) van a `overflow[b]`, una lista de (x, y, id).
+    """
+
+    def __init__(self, capacity=4, initial=4):
         self.capacity = capacity
+        self.xs = np.empty((initial, capacity), dtype=np.float64)
+        self.ys = np.empty((initial, capacity), dtype=np.float64)
+        self.ids = np.empty((initial, capacity), dtype=np.int64)
+        self.counts = np.zeros(initial, dtype=np.int32)
+        self.overflow = {}
+        self._n = 0
 
-    def insert(self, point):
-        if len(self.points) < self.capacity:
-            self.points.append(point)
-            return True
-        return False
+    def __len__(self):
+        return self._n
 
-    def __repr__(self):
-        return f"Bucket({self.points})"
+    def new(self):
+        """Reserva un bucket vacío y devuelve su id."""
+        if self._n == len(self.counts):
+            rows = 2 * len(self.counts)
+            for name in ('xs', 'ys', 'ids'):
+                old = getattr(self, name)
+                grown = np.empty((rows, self.capacity), dtype=old.dtype)
+                grown[:self._n] = old[:self._n]
+                setattr(self, name, grown)
+            counts = np.zeros(rows, dtype=np.int32)
+            counts[:self._n] = self.counts[:self._n]
+            self.counts = counts
+        self.counts[self._n] = 0
+        self._n += 1
+        return self._n - 1
+
+    def size(self, b):
+        return int(self.counts[b]) + len(self.overflow.get(b, ()))
+
+    def add(self, b, x, y, row_id):
+        """Agrega el punto si hay espacio; False si el bucket está lleno."""
+        c = self.counts[b]
+        if c >= self.capacity:
+            return False
+        self.xs[b, c] = x
+        self.ys[b, c] = y
+        self.ids[b, c] = row_id
+        self.counts[b] = c + 1
+        return True
+
+    def force(self, b, x, y, row_id):
+        """Agrega el punto aunque el bucket esté lleno (desborde)."""
+        if not self.add(b, x, y, row_id):
+            self.overflow.setdefault(b, []).append((x, y, row_id))
+
+    def fill(self, b, xs, ys, ids):
+        """Reemplaza el contenido del bucket b (listas o arreglos); lo que exceda la
+        capacidad desborda."""
+        k = min(len(xs), self.capacity)
+        self.xs[b, :k] = xs[:k]
+        self.ys[b, :k] = ys[:k]
+        self.ids[b, :k] = ids[:k]
+        self.counts[b] = k
+        self.overflow.pop(b, None)
+        if len(xs) > k:
+            self.overflow[b] = list(zip(np.asarray(xs[k:]).tolist(), np.asarray(ys[k:]).tolist(),
+                                        np.asarray(ids[k:]).tolist()))
 
+    def split(self, b, b2, axis, bound):
+        """Reparte el bucket b: quedan en b los puntos con coordenada `axis` (0 = x,
+        1 = y) menor que bound y el resto pasa al bucket b2.
+        Con filas de pocas columnas es más barato particionar listas que arreglos."""
+        c = self.counts[b]
+        rows = list(zip(self.xs[b, :c].tolist(), self.ys[b, :c].tolist(), self.ids[b, :c].tolist()))
+        rows.extend(self.overflow.get(b, ()))
+        low = [r for r in rows if r[axis] < bound]
+        high = [r for r in rows if r[axis] >= bound]
+        for dest, part in ((b, low), (b2, high)):
+            self.fill(dest, [r[0] for r in part], [r[1] for r in part], [r[2] for r in part])
+
+    def fill_many(self, buckets, starts, ends, xs, ys, ids):
+        """Carga vectorizada: el bucket buckets[k] recibe xs/ys/ids[starts[k]:ends[k]]."""
+        buckets, starts, ends = (np.asarray(a, dtype=np.intp) for a in (buckets, starts, ends))
+        sizes = ends - starts
+        rows = np.repeat(buckets, sizes)
+        cols = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        src = np.repeat(starts, sizes) + cols
+        fit = cols < self.capacity
+        self.xs[rows[fit], cols[fit]] = xs[src[fit]]
+        self.ys[rows[fit], cols[fit]] = ys[src[fit]]
+        self.ids[rows[fit], cols[fit]] = ids[src[fit]]
+        self.counts[buckets] = np.minimum(sizes, self.capacity)
+        for k in np.flatnonzero(sizes > self.capacity).tolist():
+            lo, hi = starts[k] + self.capacity, ends[k]
+            self.overflow[int(buckets[k])] = list(zip(xs[lo:hi].tolist(), ys[lo:hi].tolist(), ids[lo:hi].tolist()))
+
+    def entries(self, b):
+        """Arreglos (xs, ys, ids) con todos los puntos del bucket b."""
+        c = self.counts[b]
+        xs, ys, ids = self.xs[b, :c], self.ys[b, :c], self.ids[b, :c]
+        extra = self.overflow.get(b)
+        if extra:
+            ex, ey, ei = zip(*extra)
+            xs, ys, ids = np.concatenate((xs, ex)), np.concatenate((ys, ey)), np.concatenate((ids, ei))
+        return xs, ys, ids
+
+    def points(self, b):
+        xs, ys, _ = self.entries(b)
+        return list(zip(xs.tolist(), ys.tolist()))
+
+    def query(self, buckets, xmin, xmax, ymin, ymax):
+        """Puntos de los buckets dados dentro del rectángulo, como arreglos (xs, ys, ids).
+        Un solo barrido vectorizado sobre todas las filas."""
+        buckets = np.asarray(buckets, dtype=np.intp)
+        xs, ys = self.xs[buckets], self.ys[buckets]
+        used = np.arange(self.capacity) < self.counts[buckets][:, None]
+        mask = used & (xs >= xmin) & (xs <= xmax) & (ys >= ymin) & (ys <= ymax)
+        rx, ry, ri = xs[mask], ys[mask], self.ids[buckets][mask]
+
+        if self.overflow:
+            extra = [e for b in buckets.tolist() for e in self.overflow.get(b, ())
+                     if xmin <= e[0] <= xmax and ymin <= e[1] <= ymax]
+            if extra:
+                ex, ey, ei = zip(*extra)
+                rx, ry, ri = np.concatenate((rx, ex)), np.concatenate((ry, ey)), np.concatenate((ri, ei))
+        return rx, ry, ri
+
+    def num_points(self):
+        return int(self.counts[:self._n].sum()) + sum(len(v) for v in self.overflow.values())
+
+    def nbytes(self):
+        return self.xs.nbytes + self.ys.nbytes + self.ids.nbytes + self.counts.nbytes
+
+    def __repr__(self):
+        return f"BucketArray(buckets={self._n}, capacity={self.capacity}, points={self.num_points()})"
@@ -1,73 +1,151 @@
 import numpy as np
 
+# Balance por peso (estilo scapegoat): un nodo está desbalanceado si un hijo tiene
+# más de ALPHA del subárbol; SLACK tolera los subárboles pequeños.
+ALPHA = 0.7
+SLACK = 1
+
 class AdaptiveKDNode:
-    def __init__(self, points=None, depth=0):
+    def __init__(self, points=None, depth=0, ids=None):
         self.left = None
         self.right = None
         self.axis = None
         self.point = None
+        self.id = None  # índice del punto (por defecto, su posición en `points`)
+        self.size = 0   # nodos del subárbol (incluye este)
+        self.lo = None  # caja envolvente de los puntos del subárbol
+        self.hi = None
         
         if points is not None and len(points) > 0:
-            self.build(points, depth)
-
-    def build(self, points, depth):
-        """Construye un nodo eligiendo el eje de mayor varianza."""
-        points = np.array(points)
-        variances = np.var(points, axis=0)
-        self.axis = np.argmax(variances)   # eje de mayor varianza
-
-        # ordenar por el eje adaptativo
-        points = points[points[:, self.axis].argsort()]
-
-        median_idx = len(points)//2
-        self.point = points[median_idx]
-
-        left_points = points[:median_idx]
-        right_points = points[median_idx+1:]
+            self.build(points, depth, ids)
 
-        if len(left_points) > 0:
-            self.left = AdaptiveKDNode(left_points, depth+1)
-        if len(right_points) > 0:
-            self.right = AdaptiveKDNode(right_points, depth+1)
+    def build(self, points, depth, ids=None):
+        """Construye un nodo eligiendo el eje de mayor varianza.
 
-    def insert(self, point):
-        """Inserta un nuevo punto manteniendo el eje adaptativo local."""
-        if point[self.axis] < self.point[self.axis]:
-            if self.left:
-                self.left.insert(point)
-            else:
-                self.left = AdaptiveKDNode([point])
+        Primero se planifica el subárbol completo sobre índices (plan_subtree) y
+        luego se crean los nodos (assemble); la construcción paralela reutiliza
+        las mismas dos fases."""
+        points = np.array(points)
+        n = len(points)
+        order = np.empty(n, dtype=np.int64)
+        axes = np.empty(n, dtype=np.int8)
+        nleft = np.empty(n, dtype=np.int64)
+        plan_subtree(points, np.arange(n), 0, n, 0, order, axes, nleft)
+        if ids is None:
+            ids = order
+        elif any(i is None for i in ids):
+            ids = None      # puntos insertados sin id
         else:
-            if self.right:
-                self.right.insert(point)
+            ids = np.asarray(ids, dtype=np.int64)[order]
+        self.assemble(points[order], axes, nleft, ids)
+
+    def assemble(self, preorder_points, axes, nleft, preorder_ids=None):
+        """Crea el subárbol a partir de un plan en preorden: punto, eje y tamaño del
+        hijo izquierdo de cada nodo (el derecho es el resto), y opcionalmente el id
+        de cada punto."""
+        n = len(preorder_points)
+        nodes = []
+        sizes = np.empty(n, dtype=np.int64)
+        stack = [(self, 0, n)]
+        while stack:
+            node, pos, size = stack.pop()
+            nodes.append((node, pos))
+            sizes[pos] = size
+            node.point = preorder_points[pos]
+            node.id = int(preorder_ids[pos]) if preorder_ids is not None else None
+            node.axis = int(axes[pos])
+            node.size = size
+            node.left = node.right = None
+            n_left = int(nleft[pos])
+            n_right = size - 1 - n_left
+            if n_left:
+                node.left = AdaptiveKDNode()
+                stack.append((node.left, pos + 1, n_left))
+            if n_right:
+                node.right = AdaptiveKDNode()
+                stack.append((node.right, pos + 1 + n_left, n_right))
+
+        # en preorden cada subárbol ocupa [pos, pos + size): sus cajas salen de un
+        # solo reduceat sobre pares (inicio, fin); la fila extra cubre fin == n
+        padded = np.vstack([preorder_points, preorder_points[-1:]]).astype(np.float64)
+        bounds = np.column_stack([np.arange(n), np.arange(n) + sizes]).ravel()
+        lo = np.minimum.reduceat(padded, bounds, axis=0)[::2]
+        hi = np.maximum.reduceat(padded, bounds, axis=0)[::2]
+        for node, pos in nodes:
+            node.lo = lo[pos]
+            node.hi = hi[pos]
+
+    def insert(self, point, id=None):
+        """Inserta un nuevo punto (con su id) manteniendo el eje adaptativo local.
+
+        Baja iterativamente sumando 1 al tamaño de cada nodo del camino; después
+        reconstruye solo el nodo desbalanceado más alto del camino (si hay alguno).
+        Reconstruir m puntos cuesta O(m log m) y vuelve a dejar el subárbol
+        perfectamente balanceado, así que el costo amortizado es O(log² n).
+        """
+        path = []
+        node = self
+        while True:
+            node.size += 1
+            np.minimum(node.lo, point, out=node.lo)
+            np.maximum(node.hi, point, out=node.hi)
+            path.append(node)
+            if point[node.axis] < node.point[node.axis]:
+                if node.left is None:
+                    node.left = AdaptiveKDNode([point], ids=[id])
+                    break
+                node = node.left
             else:
-                self.right = AdaptiveKDNode([point])
+                if node.right is None:
+                    node.right = AdaptiveKDNode([point], ids=[id])
+                    break
+                node = node.right
 
-        # Rebalanceo adaptativo simple
-        self.rebalance()
+        for node in path:
+            if node.rebalance():
+                break
 
     def rebalance(self):
-        """Rebalanceo local: si la diferencia de tamaños es grande, reconstruye el nodo."""
-        def size(node):
-            if node is None:
-                return 0
-            return 1 + size(node.left) + size(node.right)
-
-        left_size = size(self.left)
-        right_size = size(self.right)
-
-        # criterio simple de desbalance
-        if max(left_size, right_size) > 3 * min(left_size, right_size + 1):
-            # reconstruir el nodo con todos sus puntos
-            points = self.collect_points()
-            self.build(points, 0)
+        """Si un hijo pesa más de ALPHA del subárbol, reconstruye el nodo con todos
+        sus puntos. Retorna True si reconstruyó."""
+        left_size = self.left.size if self.left else 0
+        right_size = self.right.size if self.right else 0
+        if max(left_size, right_size) <= ALPHA * self.size + SLACK:
+            return False
+        pts, ids = self.collect()
+        self.build(pts, 0, ids)
+        return True
+
+    def collect(self):
+        """Recolecta (puntos, ids) de todo el subárbol."""
+        pts, ids = [], []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            pts.append(node.point)
+            ids.append(node.id)
+            if node.left:  stack.append(node.left)
+            if node.right: stack.append(node.right)
+        return pts, ids
 
     def collect_points(self):
         """Recolecta todos los puntos del subárbol."""
-        pts = [self.point]
-        if self.left:  pts.extend(self.left.collect_points())
-        if self.right: pts.extend(self.right.collect_points())
-        return pts
+        return self.collect()[0]
+
+    def collect_ids(self):
+        """Recolecta los ids de todo el subárbol."""
+        return self.collect()[1]
+
+    def height(self):
+        """Altura del subárbol (1 para una hoja)."""
+        best = 0
+        stack = [(self, 1)]
+        while stack:
+            node, depth = stack.pop()
+            best = max(best, depth)
+            if node.left:  stack.append((node.left, depth + 1))
+            if node.right: stack.append((node.right, depth + 1))
+        return best
 
     def nearest_neighbor(self, target, best=None, best_dist=float("inf")):
         """Búsqueda de vecino más cercano."""
@@ -94,3 +172,34 @@ class AdaptiveKDNode:
 
         return best, best_dist
 
+
+def plan_subtree(coords, idx, s, e, pos, order, axes, nleft, max_depth=None, pending=None, depth=0):
+    """Planifica en preorden (desde `pos`) el subárbol de los puntos coords[idx[s:e]].
+
+    En cada nodo elige el eje de mayor varianza, reordena idx[s:e] por ese eje y
+    toma la mediana; escribe order[pos] (índice del punto), axes[pos] y nleft[pos]
+    (tamaño del subárbol izquierdo). Solo escribe dentro de idx[s:e] y de las
+    posiciones del subárbol, así que subárboles disjuntos pueden planificarse en
+    paralelo sobre los mismos arreglos. Con max_depth, los subárboles que quedan a
+    esa profundidad se agregan a `pending` como (s, e, pos) sin planificarse.
+    """
+    m = e - s
+    if max_depth is not None and depth == max_depth and m > 1:
+        pending.append((s, e, pos))
+        return
+    if m == 1:
+        # hoja: la varianza es 0 en todos los ejes (evita el costo fijo de NumPy)
+        axis = 0
+    else:
+        sub = idx[s:e]
+        pts = coords[sub]
+        axis = int(np.argmax(np.var(pts, axis=0)))   # eje de mayor varianza
+        idx[s:e] = sub[pts[:, axis].argsort()]
+    mid = m // 2
+    order[pos] = idx[s + mid]
+    axes[pos] = axis
+    nleft[pos] = mid
+    if mid:
+        plan_subtree(coords, idx, s, s + mid, pos + 1, order, axes, nleft, max_depth, pending, depth + 1)
+    if m - mid - 1:
+        plan_subtree(coords, idx, s + mid + 1, e, pos + 1 + mid, order, axes, nleft, max_depth, pending, depth + 1)
@@ -0,0 +1,174 @@
+import numpy as np
+
+from Nodes.R_node import R_node
+from Nodes.R_tree.Rectangle_R import Rectangle
+
+# Hasta esta cantidad de entradas, recorrer las filas con .tolist() cuesta menos que
+# las llamadas a NumPy (unos µs fijos cada una); el cruce medido está entre 48 y 64.
+SCALAR_MAX = 48
+
+
+class R_array_node(R_node):
+    """ Nodo de R-Tree con los MBR de sus hijos en un arreglo NumPy (k x 4) contiguo.
+
+    Cada fila es (xmin, ymin, xmax, ymax). Las pruebas de intersección, el cálculo
+    de expansión de área y el MBR del nodo se hacen vectorizados sobre el arreglo,
+    sin crear un objeto Rectangle por hijo. Las políticas de split de R_node se
+    reutilizan tal cual (trabajan sobre `rectangles`, que se materializa a demanda
+    y queda en caché hasta que el nodo cambia; `rect_at` también la usa).
+
+    Con pocas entradas (<= SCALAR_MAX) las consultas recorren las filas en Python:
+    el arreglo solo gana con fan-outs de decenas de entradas (ver
+    `benchmark_rtree_policies`, que compara ambos layouts).
+    """
+
+    def __init__(self, max_entries=4, leaf=False, policy='linear'):
+        self._mbrs = np.empty((max_entries + 1, 4), dtype=np.float64)
+        self._count = 0
+        self._rects = None
+        super().__init__(max_entries, leaf=leaf, policy=policy)
+
+    # --- almacenamiento ---
+    @property
+    def mbrs(self):
+        return self._mbrs[:self._count]
+
+    @property
+    def rectangles(self):
+        if self._rects is None:
+            self._rects = [Rectangle(*row) for row in self.mbrs.tolist()]
+        return self._rects
+
+    @rectangles.setter
+    def rectangles(self, rects):
+        self._set_rows([(r.xmin, r.ymin, r.xmax, r.ymax) for r in rects])
+
+    def _set_rows(self, rows):
+        rows = np.asarray(rows, dtype=np.float64).reshape(-1, 4)
+        if len(rows) > len(self._mbrs):
+            self._mbrs = np.empty((2 * len(rows), 4), dtype=np.float64)
+        self._mbrs[:len(rows)] = rows
+        self._count = len(rows)
+        self._rects = None
+
+    def _add_entry(self, rectangle, child):
+        if self._count == len(self._mbrs):
+            grown = np.empty((2 * len(self._mbrs), 4), dtype=np.float64)
+            grown[:self._count] = self.mbrs
+            self._mbrs = grown
+        self._mbrs[self._count] = (rectangle.xmin, rectangle.ymin, rectangle.xmax, rectangle.ymax)
+        self._count += 1
+        self.children.append(child)
+        self._rects = None
+
+    def _set_rect(self, i, rectangle):
+        self._mbrs[i] = (rectangle.xmin, rectangle.ymin, rectangle.xmax, rectangle.ymax)
+        self._rects = None
+
+    def _remove_entry(self, i):
+        self._mbrs[i:self._count - 1] = self._mbrs[i + 1:self._count]
+        self._count -= 1
+        del self.children[i]
+        self._rects = None
+
+    def clone(self):
+        node = type(self)(self.max_entries, leaf=self.leaf, policy=self.policy)
+        node.children = list(self.children)
+        node._set_rows(self.mbrs)
+        return node
+
+    def rect_at(self, i):
+        return self.rectangles[i]
+
+    # --- operaciones vectorizadas ---
+    def compute_mbr(self):
+        if self._count <= SCALAR_MAX:
+            xmins, ymins, xmaxs, ymaxs = zip(*self.mbrs.tolist())
+            return Rectangle(min(xmins), min(ymins), max(xmaxs), max(ymaxs))
+        m = self.mbrs
+        return Rectangle(float(m[:, 0].min()), float(m[:, 1].min()),
+                         float(m[:, 2].max()), float(m[:, 3].max()))
+
+    def recalc_mbr(self):
+        if self._count:
+            return self.compute_mbr()
+
+    def intersecting(self, query_rect):
+        # una fila intersecta si (xmin, ymin) <= (q.xmax, q.ymax) y (xmax, ymax) >= (q.xmin, q.ymin)
+        qxmin, qymin, qxmax, qymax = query_rect.xmin, query_rect.ymin, query_rect.xmax, query_rect.ymax
+        if self._count <= SCALAR_MAX:
+            return [i for i, (xmin, ymin, xmax, ymax) in enumerate(self.mbrs.tolist())
+                    if xmin <= qxmax and ymin <= qymax and xmax >= qxmin and ymax >= qymin]
+        m = self.mbrs
+        mask = (m[:, 0] <= qxmax) & (m[:, 1] <= qymax) & (m[:, 2] >= qxmin) & (m[:, 3] >= qymin)
+        return np.flatnonzero(mask).tolist()
+
+    def min_dists(self, x, y):
+        if self._count <= SCALAR_MAX:
+            out = []
+            for xmin, ymin, xmax, ymax in self.mbrs.tolist():
+                dx = max(xmin - x, 0.0, x - xmax)
+                dy = max(ymin - y, 0.0, y - ymax)
+                out.append((dx * dx + dy * dy) ** 0.5)
+            return out
+        m = self.mbrs
+        dx = np.maximum(np.maximum(m[:, 0] - x, 0.0), x - m[:, 2])
+        dy = np.maximum(np.maximum(m[:, 1] - y, 0.0), y - m[:, 3])
+        return np.hypot(dx, dy).tolist()
+
+    def linear_split(self):
+        m = self.mbrs
+        d = (np.abs(m[:, None, 0] - m[None, :, 0]) + np.abs(m[:, None, 1] - m[None, :, 1]))
+        d = np.triu(d, k=1)
+        idx1 = int(np.unravel_index(np.argmax(d), d.shape)[0]) if len(m) > 1 else 0
+        rest = [k for k in range(self._count) if k != idx1]
+        return [idx1], rest
+
+    def choose_subtree_index(self, rectangle, height=None):
+        if self._count <= SCALAR_MAX and not (self.policy == 'rstar' and height == 1):
+            # mínima expansión de área y, a igualdad, menor área (como el lexsort de abajo)
+            rxmin, rymin, rxmax, rymax = rectangle.xmin, rectangle.ymin, rectangle.xmax, rectangle.ymax
+            best, best_key = 0, None
+            for i, (xmin, ymin, xmax, ymax) in enumerate(self.mbrs.tolist()):
+                area = (xmax - xmin) * (ymax - ymin)
+                inc = ((max(xmax, rxmax) - min(xmin, rxmin)) * (max(ymax, rymax) - min(ymin, rymin))) - area
+                if best_key is None or (inc, area) < best_key:
+                    best, best_key = i, (inc, area)
+            return best
+        m = self.mbrs
+        area = (m[:, 2] - m[:, 0]) * (m[:, 3] - m[:, 1])
+        enlarged = np.column_stack((
+            np.minimum(m[:, 0], rectangle.xmin), np.minimum(m[:, 1], rectangle.ymin),
+            np.maximum(m[:, 2], rectangle.xmax), np.maximum(m[:, 3], rectangle.ymax),
+        ))
+        inc = (enlarged[:, 2] - enlarged[:, 0]) * (enlarged[:, 3] - enlarged[:, 1]) - area
+
+        if self.policy == 'rstar' and height == 1:
+            # R*: mínima expansión de superposición con los hermanos
+            overlap_inc = _overlap_sums(enlarged, m) - _overlap_sums(m, m)
+            return int(np.lexsort((area, inc, overlap_inc))[0])
+
+        return int(np.lexsort((area, inc))[0])
+
+    def split(self):
+        idx1, idx2 = self.split_groups()
+        rows = self.mbrs.copy()
+
+        new_node = type(self)(self.max_entries, leaf=self.leaf, policy=self.policy)
+        new_node.epoch = self.epoch
+        new_node.children = [self.children[i] for i in idx2]
+        new_node._set_rows(rows[idx2])
+
+        self.children = [self.children[i] for i in idx1]
+        self._set_rows(rows[idx1])
+
+        return new_node
+
+
+def _overlap_sums(a, b):
+    """ Para cada fila i de a, suma del área de intersección con las filas j != i de b """
+    dx = np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0])
+    dy = np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1])
+    overlap = np.clip(dx, 0, None) * np.clip(dy, 0, None)
+    np.fill_diagonal(overlap, 0.0)
+    return overlap.sum(axis=1)
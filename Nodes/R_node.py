@@ -1,32 +1,120 @@
+import math
+
 from Nodes.R_tree.Rectangle_R import Rectangle
 
+# Políticas de inserción/división disponibles:
+#   'linear'    -> división lineal simple (comportamiento original)
+#   'quadratic' -> división cuadrática de Guttman
+#   'rstar'     -> R*-tree: mínima superposición al elegir hoja, división por
+#                  margen/superposición y reinserción forzada
+POLICIES = ('linear', 'quadratic', 'rstar')
+
+# fracción mínima de ocupación (m = 40% de M) y fracción reinsertada en R*
+MIN_FILL = 0.4
+REINSERT_FRACTION = 0.3
+
+
 class R_node:
-    def __init__(self, max_entries=4, leaf=False):
+    def __init__(self, max_entries=4, leaf=False, policy='linear'):
+        if policy not in POLICIES:
+            raise ValueError(f"Política desconocida: {policy!r} (usar una de {POLICIES})")
         self.children = []      # hijos o datos
         self.rectangles = []    # MBR de cada hijo
         self.leaf = leaf
         self.max_entries = max_entries
+        self.policy = policy
+        self.epoch = 0          # versión de escritura que creó el nodo (modo concurrente)
+
+    @property
+    def min_entries(self):
+        return max(1, math.ceil(self.max_entries * MIN_FILL))
+
+    def choose_subtree(self, rectangle, height=None):
+        return self.children[self.choose_subtree_index(rectangle, height)]
 
-    def choose_subtree(self, rectangle):
-        """ Regla heurística simple: mínima expansión de área """
-        best = None
+    def choose_subtree_index(self, rectangle, height=None):
+        """ Mínima expansión de área; en R* mínima expansión de superposición sobre hojas """
+        if self.policy == 'rstar' and height == 1:
+            return self._least_overlap_index(rectangle)
+
+        best = 0
         best_inc = float("inf")
+        best_area = float("inf")
 
-        for child, rect in zip(self.children, self.rectangles):
+        for i, rect in enumerate(self.rectangles):
             old_area = rect.area()
             new_rect = Rectangle(rect.xmin, rect.ymin, rect.xmax, rect.ymax)
             new_rect.enlarge_to_contain(rectangle)
             inc = new_rect.area() - old_area
 
-            if inc < best_inc:
+            if inc < best_inc or (inc == best_inc and old_area < best_area):
                 best_inc = inc
-                best = child
+                best_area = old_area
+                best = i
+
+        return best
+
+    def _least_overlap_index(self, rectangle):
+        best = 0
+        best_key = None
+
+        for i, rect in enumerate(self.rectangles):
+            enlarged = rect.union(rectangle)
+            overlap_inc = 0.0
+            for j, other in enumerate(self.rectangles):
+                if j != i:
+                    overlap_inc += enlarged.overlap(other) - rect.overlap(other)
+            area = rect.area()
+            key = (overlap_inc, enlarged.area() - area, area)
+
+            if best_key is None or key < best_key:
+                best_key = key
+                best = i
 
         return best
 
     def compute_mbr(self):
         return Rectangle.bounding(self.rectangles)
 
+    def rect_at(self, i):
+        return self.rectangles[i]
+
+    def intersecting(self, query_rect):
+        """ Índices de las entradas cuyo MBR intersecta query_rect """
+        return [i for i, rect in enumerate(self.rectangles) if rect.intersects(query_rect)]
+
+    def min_dists(self, x, y):
+        """ MINDIST de (x, y) a cada MBR hijo """
+        return [rect.min_dist(x, y) for rect in self.rectangles]
+
+    def _add_entry(self, rectangle, child):
+        self.children.append(child)
+        self.rectangles.append(rectangle)
+
+    def _set_rect(self, i, rectangle):
+        self.rectangles[i] = rectangle
+
+    def _remove_entry(self, i):
+        del self.children[i]
+        del self.rectangles[i]
+
+    def clone(self):
+        """ Copia superficial del nodo (mismos hijos, listas propias) """
+        node = type(self)(self.max_entries, leaf=self.leaf, policy=self.policy)
+        node.children = list(self.children)
+        node.rectangles = list(self.rectangles)
+        return node
+
+    def _child_for_write(self, i, epoch):
+        """ Hijo i listo para modificarse: si pertenece a otra versión publicada
+        (copy-on-write) se clona y se enlaza la copia en este nodo """
+        child = self.children[i]
+        if epoch is not None and child.epoch != epoch:
+            child = child.clone()
+            child.epoch = epoch
+            self.children[i] = child
+        return child
+
     def recalc_mbr(self):
         if self.rectangles:
             return Rectangle.bounding(self.rectangles)
@@ -45,15 +133,114 @@ class R_node:
                     max_dist = d
                     idx1, idx2 = i, j
 
-        all_idx = list(range(len(self.rectangles)))
-        all_idx.remove(idx2)
+        rest = [k for k in range(len(self.rectangles)) if k != idx1]
+
+        return [idx1], rest
+
+    def quadratic_split(self):
+        """ División cuadrática de Guttman """
+        rects = self.rectangles
+        m = self.min_entries
+
+        # PickSeeds: el par que más área desperdicia si quedara junto
+        worst = -float("inf")
+        s1, s2 = 0, 1
+        for i in range(len(rects)):
+            for j in range(i + 1, len(rects)):
+                d = rects[i].union(rects[j]).area() - rects[i].area() - rects[j].area()
+                if d > worst:
+                    worst = d
+                    s1, s2 = i, j
 
-        return [idx1], [idx2] + all_idx[1:]
+        group1, group2 = [s1], [s2]
+        mbr1, mbr2 = rects[s1], rects[s2]
+        remaining = [k for k in range(len(rects)) if k not in (s1, s2)]
+
+        while remaining:
+            # si un grupo necesita todas las restantes para llegar a m, se las lleva
+            if len(group1) + len(remaining) == m:
+                group1.extend(remaining)
+                break
+            if len(group2) + len(remaining) == m:
+                group2.extend(remaining)
+                break
+
+            # PickNext: la entrada con mayor preferencia por uno de los grupos
+            best_k, best_diff = None, -1.0
+            for k in remaining:
+                d1 = mbr1.union(rects[k]).area() - mbr1.area()
+                d2 = mbr2.union(rects[k]).area() - mbr2.area()
+                if abs(d1 - d2) > best_diff:
+                    best_diff = abs(d1 - d2)
+                    best_k, best_d1, best_d2 = k, d1, d2
+            remaining.remove(best_k)
+
+            key1 = (best_d1, mbr1.area(), len(group1))
+            key2 = (best_d2, mbr2.area(), len(group2))
+            if key1 <= key2:
+                group1.append(best_k)
+                mbr1 = mbr1.union(rects[best_k])
+            else:
+                group2.append(best_k)
+                mbr2 = mbr2.union(rects[best_k])
+
+        return group1, group2
+
+    def rstar_split(self):
+        """ División R*: eje de menor margen total y corte de menor superposición """
+        rects = self.rectangles
+        n = len(rects)
+        m = self.min_entries
+
+        def distributions(order):
+            for k in range(m, n - m + 1):
+                yield order[:k], order[k:]
+
+        def sort_orders(axis):
+            if axis == 0:
+                yield sorted(range(n), key=lambda i: (rects[i].xmin, rects[i].xmax))
+                yield sorted(range(n), key=lambda i: (rects[i].xmax, rects[i].xmin))
+            else:
+                yield sorted(range(n), key=lambda i: (rects[i].ymin, rects[i].ymax))
+                yield sorted(range(n), key=lambda i: (rects[i].ymax, rects[i].ymin))
+
+        # ChooseSplitAxis
+        best_axis, best_margin = 0, float("inf")
+        for axis in (0, 1):
+            margin = 0.0
+            for order in sort_orders(axis):
+                for g1, g2 in distributions(order):
+                    margin += (Rectangle.bounding([rects[i] for i in g1]).margin() +
+                               Rectangle.bounding([rects[i] for i in g2]).margin())
+            if margin < best_margin:
+                best_margin = margin
+                best_axis = axis
+
+        # ChooseSplitIndex
+        best, best_key = None, None
+        for order in sort_orders(best_axis):
+            for g1, g2 in distributions(order):
+                b1 = Rectangle.bounding([rects[i] for i in g1])
+                b2 = Rectangle.bounding([rects[i] for i in g2])
+                key = (b1.overlap(b2), b1.area() + b2.area())
+                if best_key is None or key < best_key:
+                    best_key = key
+                    best = (list(g1), list(g2))
+
+        return best
+
+    def split_groups(self):
+        if self.policy == 'quadratic':
+            return self.quadratic_split()
+        if self.policy == 'rstar':
+            return self.rstar_split()
+        return self.linear_split()
 
     def split(self):
-        idx1, idx2 = self.linear_split()
+        idx1, idx2 = self.split_groups()
 
-        new_node = R_node(self.max_entries, leaf=self.leaf)
+        new_node = type(self)(self.max_entries, leaf=self.leaf, policy=self.policy)
+        new_node.epoch = self.epoch
 
         new_node.children   = [self.children[i]   for i in idx2]
         new_node.rectangles = [self.rectangles[i] for i in idx2]
@@ -63,27 +250,60 @@ class R_node:
 
         return new_node
 
-    def insert(self, rectangle, data):
-        """ Inserta en hoja o nodo interno """
-        if self.leaf:
-            self.children.append(data)
-            self.rectangles.append(rectangle)
+    def _take_for_reinsert(self):
+        """ Quita las entradas más alejadas del centro del nodo (R* forced reinsert) """
+        cx, cy = self.compute_mbr().center()
+        rects = self.rectangles
+
+        def dist(i):
+            ex, ey = rects[i].center()
+            return (ex - cx) ** 2 + (ey - cy) ** 2
+
+        order = sorted(range(len(rects)), key=dist)
+        p = max(1, int(self.max_entries * REINSERT_FRACTION))
+        keep, removed = order[:-p], order[-p:]
+
+        taken = [(rects[i], self.children[i]) for i in removed]
+        self.children   = [self.children[i] for i in keep]
+        self.rectangles = [rects[i] for i in keep]
+        return taken
+
+    def _overflow(self, height, ctx):
+        """ Trata un nodo con M+1 entradas: reinserción forzada (R*) o split """
+        if (self.policy == 'rstar' and ctx is not None and ctx.get('root') is not self
+                and height not in ctx['reinserted']):
+            ctx['reinserted'].add(height)
+            for rect, child in self._take_for_reinsert():
+                ctx['pending'].append((rect, child, height))
+            return None
+        return self.split()
+
+    def insert(self, rectangle, data, height=0, level=0, ctx=None):
+        """ Inserta en hoja o nodo interno.
+
+        `height` es la altura de este nodo (0 = hoja) y `level` la altura del nodo
+        que debe recibir la entrada (0 para datos; >0 al reinsertar subárboles).
+        `ctx` lo crea RTree para coordinar la reinserción forzada de R*.
+        """
+        if height == level:
+            self._add_entry(rectangle, data)
 
             if len(self.children) > self.max_entries:
-                return self.split()
+                return self._overflow(height, ctx)
             return None
-        
+
         # Nodo interno: buscar subárbol
-        best = self.choose_subtree(rectangle)
-        split_child = best.insert(rectangle, data)
+        i = self.choose_subtree_index(rectangle, height)
+        best = self._child_for_write(i, ctx.get('epoch') if ctx is not None else None)
+        split_child = best.insert(rectangle, data, height - 1, level, ctx)
 
-        if split_child:
-            self.children.append(split_child)
-            self.rectangles.append(split_child.compute_mbr())
+        # el MBR del hijo puede haber crecido (o encogido tras un split)
+        self._set_rect(i, best.compute_mbr())
 
-        self.recalc_mbr()
+        if split_child:
+            self._add_entry(split_child.compute_mbr(), split_child)
 
         if len(self.children) > self.max_entries:
-            return self.split()
+            return self._overflow(height, ctx)
 
         return None
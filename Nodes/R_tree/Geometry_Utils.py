@@ -3,6 +3,8 @@
 # Compatibiliza la API con Shapely o con la clase Polygon personalizada
 # ================================
 
+import numpy as np
+
 def rect_bounds(rect):
     return rect.xmin, rect.ymin, rect.xmax, rect.ymax
 
@@ -89,6 +91,9 @@ def _segments_intersect(a1, a2, b1, b2):
 
 
 def rect_polygon_intersection(rect, polygon):
+    if isinstance(polygon, PreparedPolygon):
+        return polygon.intersects_rect(rect)
+
     xmin, ymin, xmax, ymax = rect_bounds(rect)
 
     # 1. Descarta rápido usando bounding box del polígono
@@ -134,6 +139,121 @@ def rect_polygon_intersection(rect, polygon):
     return False
 
 
+# ---- Polígono preparado para el paso de refinamiento
+# tamaño máximo (rectángulos x aristas) de las matrices intermedias por bloque
+_REFINE_BLOCK = 1 << 18
+
+
+class PreparedPolygon:
+    """
+    Polígono con coordenadas, MBR y aristas precalculados como arreglos NumPy.
+    Se construye una vez por consulta y permite evaluar muchos rectángulos
+    candidatos de una sola pasada vectorizada (`intersects_rects`).
+    """
+    def __init__(self, polygon):
+        coords = np.asarray(_coords_from_polygon(polygon), dtype=np.float64).reshape(-1, 2)
+        # el anillo cerrado (último == primero) solo aporta una arista degenerada
+        if len(coords) > 1 and np.array_equal(coords[0], coords[-1]):
+            coords = coords[:-1]
+        if len(coords) == 0:
+            raise TypeError('Polígono sin vértices')
+
+        self.coords = coords
+        self.starts = coords
+        self.ends = np.roll(coords, -1, axis=0)
+        self.edges = self.ends - self.starts
+        self.bounds = (float(coords[:, 0].min()), float(coords[:, 1].min()),
+                       float(coords[:, 0].max()), float(coords[:, 1].max()))
+
+    def to_tuples(self):
+        return [tuple(c) for c in self.coords.tolist()]
+
+    def intersects_rect(self, rect):
+        return bool(self.intersects_rects([rect_bounds(rect)])[0])
+
+    def intersects_rects(self, boxes):
+        """
+        boxes: arreglo (n x 4) de (xmin, ymin, xmax, ymax) o secuencia de Rectangle.
+        Retorna un arreglo booleano (n,) con True donde el rectángulo toca el polígono.
+        """
+        if len(boxes) and hasattr(boxes[0], 'xmin'):
+            boxes = [rect_bounds(r) for r in boxes]
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        result = np.zeros(len(boxes), dtype=bool)
+
+        # 1. descarte por MBR del polígono
+        pminx, pminy, pmaxx, pmaxy = self.bounds
+        candidates = np.flatnonzero(~((pmaxx < boxes[:, 0]) | (pminx > boxes[:, 2]) |
+                                      (pmaxy < boxes[:, 1]) | (pminy > boxes[:, 3])))
+
+        step = max(1, _REFINE_BLOCK // len(self.coords))
+        for k in range(0, len(candidates), step):
+            idx = candidates[k:k + step]
+            b = boxes[idx]
+            # 2. alguna arista toca el rectángulo, o 3. el rectángulo está dentro del polígono
+            result[idx] = self._edges_touch(b) | self._contains_points(b[:, 0], b[:, 1])
+        return result
+
+    def contains_rects(self, boxes):
+        """
+        boxes: arreglo (n x 4) de (xmin, ymin, xmax, ymax).
+        Retorna un arreglo booleano (n,) con True donde el rectángulo queda por completo
+        dentro del polígono: ninguna arista lo toca y una esquina está dentro.
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        result = np.zeros(len(boxes), dtype=bool)
+
+        pminx, pminy, pmaxx, pmaxy = self.bounds
+        candidates = np.flatnonzero((boxes[:, 0] >= pminx) & (boxes[:, 2] <= pmaxx) &
+                                    (boxes[:, 1] >= pminy) & (boxes[:, 3] <= pmaxy))
+
+        step = max(1, _REFINE_BLOCK // len(self.coords))
+        for k in range(0, len(candidates), step):
+            idx = candidates[k:k + step]
+            b = boxes[idx]
+            result[idx] = ~self._edges_touch(b) & self._contains_points(b[:, 0], b[:, 1])
+        return result
+
+    def _edges_touch(self, b):
+        """ (m,) True si alguna arista del polígono toca el rectángulo (test de ejes separadores) """
+        x0, y0 = self.starts[:, 0], self.starts[:, 1]
+        x1, y1 = self.ends[:, 0], self.ends[:, 1]
+        bxmin, bymin = b[:, 0:1], b[:, 1:2]
+        bxmax, bymax = b[:, 2:3], b[:, 3:4]
+
+        # ejes x/y: el MBR de la arista debe solapar el rectángulo
+        overlap = ((np.minimum(x0, x1) <= bxmax) & (np.maximum(x0, x1) >= bxmin) &
+                   (np.minimum(y0, y1) <= bymax) & (np.maximum(y0, y1) >= bymin))
+
+        # normal de la arista: las 4 esquinas no pueden quedar estrictamente de un mismo lado
+        dx, dy = self.edges[:, 0], self.edges[:, 1]
+        sides = [dx * (cy - y0) - dy * (cx - x0)
+                 for cx, cy in ((bxmin, bymin), (bxmax, bymin), (bxmax, bymax), (bxmin, bymax))]
+        all_pos = (sides[0] > 0) & (sides[1] > 0) & (sides[2] > 0) & (sides[3] > 0)
+        all_neg = (sides[0] < 0) & (sides[1] < 0) & (sides[2] < 0) & (sides[3] < 0)
+
+        return (overlap & ~all_pos & ~all_neg).any(axis=1)
+
+    def _contains_points(self, px, py):
+        """ Ray casting vectorizado (misma regla que _point_in_polygon) """
+        px, py = px[:, None], py[:, None]
+        x1, y1 = self.starts[:, 0], self.starts[:, 1]
+        x2, y2 = self.ends[:, 0], self.ends[:, 1]
+        crosses = ((y1 > py) != (y2 > py)) & (px < (x2 - x1) * (py - y1) / (y2 - y1 + 1e-12) + x1)
+        return (crosses.sum(axis=1) % 2) == 1
+
+
+def prepare_polygon(polygon):
+    if isinstance(polygon, PreparedPolygon):
+        return polygon
+    return PreparedPolygon(polygon)
+
+
+def rects_polygon_intersection(boxes, polygon):
+    """ Versión por lotes de rect_polygon_intersection: boxes (n x 4) -> arreglo booleano (n,) """
+    return prepare_polygon(polygon).intersects_rects(boxes)
+
+
 def enlarge_rect(rect, other):
     rect.xmin = min(rect.xmin, other.xmin)
     rect.ymin = min(rect.ymin, other.ymin)
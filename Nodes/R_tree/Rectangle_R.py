@@ -21,6 +21,30 @@ class Rectangle:
     def area(self):
         return (self.xmax - self.xmin) * (self.ymax - self.ymin)
 
+    def margin(self):
+        return 2 * ((self.xmax - self.xmin) + (self.ymax - self.ymin))
+
+    def overlap(self, other):
+        """ Área de la intersección con otro rectángulo (0 si no se cortan) """
+        dx = min(self.xmax, other.xmax) - max(self.xmin, other.xmin)
+        dy = min(self.ymax, other.ymax) - max(self.ymin, other.ymin)
+        if dx <= 0 or dy <= 0:
+            return 0.0
+        return dx * dy
+
+    def union(self, other):
+        return Rectangle(min(self.xmin, other.xmin), min(self.ymin, other.ymin),
+                         max(self.xmax, other.xmax), max(self.ymax, other.ymax))
+
+    def min_dist(self, x, y):
+        """ MINDIST: distancia euclídea del punto (x, y) al rectángulo (0 si está dentro) """
+        dx = max(self.xmin - x, 0.0, x - self.xmax)
+        dy = max(self.ymin - y, 0.0, y - self.ymax)
+        return (dx * dx + dy * dy) ** 0.5
+
+    def center(self):
+        return (self.xmin + self.xmax) / 2.0, (self.ymin + self.ymax) / 2.0
+
     @staticmethod
     def bounding(rectangles):
         xmin = min(r.xmin for r in rectangles)
@@ -16,4 +16,10 @@ class Rectangle_Q:
         return not (range_rect.x - range_rect.w > self.x + self.w or
                     range_rect.x + range_rect.w < self.x - self.w or
                     range_rect.y - range_rect.h > self.y + self.h or
-                    range_rect.y + range_rect.h < self.y - self.h)
\ No newline at end of file
+                    range_rect.y + range_rect.h < self.y - self.h)
+
+    def min_dist(self, x, y):
+        """ Distancia euclídea del punto (x, y) al rectángulo (0 si está dentro) """
+        dx = max(self.x - self.w - x, 0.0, x - (self.x + self.w))
+        dy = max(self.y - self.h - y, 0.0, y - (self.y + self.h))
+        return (dx * dx + dy * dy) ** 0.5
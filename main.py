@@ -20,7 +20,7 @@ try:
 except Exception:
     HAS_MPL = False
 
-from trees.metrics import benchmark_gridfile, benchmark_rtree, analyze_gridfile_instance, analyze_rtree_instance
+from trees.metrics import benchmark_gridfile, benchmark_rtree, benchmark_kdtree, analyze_gridfile_instance, analyze_rtree_instance
 from trees.osm_loader import fetch_pois_by_bbox
 
 from Nodes.R_tree.Point import Point
@@ -31,7 +31,6 @@ from trees.Grid_file import GridFile
 from trees.KD_tree import AdaptiveKDTree
 from trees.Quad_tree import QuadTree
 from Nodes.Rectangle_Q import Rectangle_Q
-from Nodes.Bucket import Bucket
 
 
 class MapWindow(QMainWindow):
@@ -128,15 +127,16 @@ class MapWindow(QMainWindow):
             self.tree.insert(r, data)
 
         # Inicializar las otras estructuras: GridFile, KD-Tree, QuadTree
+        # el dominio del GridFile crece con los POIs que se van cargando; el grid guarda
+        # el índice de cada POI en `gridfile_rows` (range_query(..., ids=True))
         self.gridfile = GridFile(capacity=4)
-        # Default a una extensión mundial; se reconfigurará en cada búsqueda
-        self.gridfile.x_splits = [-180.0, 180.0]
-        self.gridfile.y_splits = [-90.0, 90.0]
-        self.gridfile.directory = {(0, 0): Bucket(self.gridfile.capacity)}
+        self.gridfile_rows = []
 
-        self.kdtree = AdaptiveKDTree()
+        # [lon, lat] en modo geodésico: nearest devuelve metros
+        self.kdtree = AdaptiveKDTree(geodesic=True)
 
-        # QuadTree: boundary usa (x=lon, y=lat, w,h = mitad de ancho/alto)
+        # QuadTree: boundary usa (x=lon, y=lat, w,h = mitad de ancho/alto); la raíz
+        # crece sola si se cargan POIs fuera de esta área
         self.quadtree = QuadTree(Rectangle_Q(self.center[1], self.center[0], 0.2, 0.2), capacity=4)
 
         self.text_panel = text_panel
@@ -282,6 +282,7 @@ class MapWindow(QMainWindow):
 
             # Insertar en RTree como pequeños rectángulos y construir nuevo mapa con marcadores
             mapa = folium.Map(location=[lat_center, lon_center], zoom_start=13)
+            rtree_entries = []
             for p in pois:
                 lat = p.get('lat')
                 lon = p.get('lon')
@@ -293,18 +294,13 @@ class MapWindow(QMainWindow):
 
                 # Insertar condicionalmente según 'target'
                 if target in ('Todos', 'RTree'):
-                    try:
-                        self.tree.insert(r, data)
-                    except Exception:
-                        pass
+                    # se acumulan y se cargan en bloque al final del recorrido
+                    rtree_entries.append((r, data))
 
                 if target in ('Todos', 'GridFile'):
                     try:
-                        # normalizar grid a la caja de búsqueda
-                        self.gridfile.x_splits = [west, east]
-                        self.gridfile.y_splits = [south, north]
-                        self.gridfile.directory = {(0, 0): Bucket(self.gridfile.capacity)}
-                        self.gridfile.insert(lon, lat)
+                        self.gridfile.insert(lon, lat, row_id=len(self.gridfile_rows))
+                        self.gridfile_rows.append(data)
                     except Exception:
                         pass
 
@@ -324,6 +320,14 @@ class MapWindow(QMainWindow):
                 popup = p.get('tags', {}).get('name', str(p.get('id')))
                 folium.CircleMarker(location=[lat, lon], radius=3, popup=popup, color='blue', fill=True).add_to(mapa)
 
+            if rtree_entries:
+                try:
+                    # reconstrucción empaquetada (STR) con las entradas previas + las nuevas
+                    self.tree = RTree.bulk_load(self.tree.items() + rtree_entries,
+                                                max_entries=self.tree.root.max_entries)
+                except Exception:
+                    pass
+
             # Guardar mapa temporal y reinyectar draw + channel
             temp = tempfile.NamedTemporaryFile(delete=False, suffix=".html")
             mapa.save(temp.name)
@@ -360,11 +364,13 @@ class MapWindow(QMainWindow):
 
         gf_res = None
         rt_res = None
+        kd_res = None
 
         if choice == choices[0]:
             # sintético (comportamiento por defecto)
             gf_res = benchmark_gridfile(sizes, capacity=4)
             rt_res = benchmark_rtree(sizes, max_entries=4)
+            kd_res = benchmark_kdtree(sizes)
         elif choice == choices[1]:
             # usar GridFile actual
             try:
@@ -454,7 +460,26 @@ class MapWindow(QMainWindow):
             ax2.legend()
 
             self.canvas.draw()
-            self.text_panel.setPlainText('Benchmarks completos. Ver gráficos.')
+            lines = ['Benchmarks completos. Ver gráficos.']
+            if gf_res is not None and 'bulk_times' in gf_res:
+                lines.append('')
+                lines.append('GridFile: inserción incremental vs construcción por cuantiles')
+                for s, t, bt, lf, blf in zip(gf_res['sizes'], gf_res['times'], gf_res['bulk_times'],
+                                             gf_res['load_factors'], gf_res['bulk_load_factors']):
+                    lines.append(f"N={s}: insert={t:.4f}s (lf={lf:.3f}), bulk={bt:.4f}s (lf={blf:.3f})")
+            if rt_res is not None and 'bulk_times' in rt_res:
+                lines.append('')
+                lines.append('RTree: inserción incremental vs carga STR')
+                for s, t, bt, lf, blf in zip(rt_res['sizes'], rt_res['times'], rt_res['bulk_times'],
+                                             rt_res['load_factors'], rt_res['bulk_load_factors']):
+                    lines.append(f"N={s}: insert={t:.4f}s (lf={lf:.3f}), bulk={bt:.4f}s (lf={blf:.3f})")
+            if kd_res is not None:
+                lines.append('')
+                lines.append('KD-Tree: inserción incremental vs construcción completa')
+                for s, t, ips, h, bt in zip(kd_res['sizes'], kd_res['times'], kd_res['inserts_per_sec'],
+                                            kd_res['heights'], kd_res['bulk_times']):
+                    lines.append(f"N={s}: insert={t:.4f}s ({ips:.0f} ins/s, altura={h}), bulk={bt:.4f}s")
+            self.text_panel.setPlainText("\n".join(lines))
         else:
             # Mostrar resumen numérico en el panel
             lines = ["matplotlib no está instalado. Instala con: pip install matplotlib", ""]
@@ -462,11 +487,25 @@ class MapWindow(QMainWindow):
                 lines.append("GridFile:")
                 for s, t, m, lf in zip(gf_res['sizes'], gf_res['times'], gf_res['mem_peaks'], gf_res['load_factors']):
                     lines.append(f"N={s}: time={t:.4f}s, mem_peak={m/1024:.1f} KiB, load_factor={lf:.3f}")
+                if 'bulk_times' in gf_res:
+                    lines.append("GridFile (construcción por cuantiles):")
+                    for s, t, m, lf in zip(gf_res['sizes'], gf_res['bulk_times'], gf_res['bulk_mem_peaks'], gf_res['bulk_load_factors']):
+                        lines.append(f"N={s}: time={t:.4f}s, mem_peak={m/1024:.1f} KiB, load_factor={lf:.3f}")
                 lines.append("")
             if rt_res is not None:
                 lines.append("RTree:")
                 for s, t, m, lf in zip(rt_res['sizes'], rt_res['times'], rt_res['mem_peaks'], rt_res['load_factors']):
                     lines.append(f"N={s}: time={t:.4f}s, mem_peak={m/1024:.1f} KiB, load_factor={lf:.3f}")
+                if 'bulk_times' in rt_res:
+                    lines.append("RTree (carga STR):")
+                    for s, t, m, lf in zip(rt_res['sizes'], rt_res['bulk_times'], rt_res['bulk_mem_peaks'], rt_res['bulk_load_factors']):
+                        lines.append(f"N={s}: time={t:.4f}s, mem_peak={m/1024:.1f} KiB, load_factor={lf:.3f}")
+            if kd_res is not None:
+                lines.append("")
+                lines.append("KD-Tree:")
+                for s, t, ips, m, h in zip(kd_res['sizes'], kd_res['times'], kd_res['inserts_per_sec'],
+                                           kd_res['mem_peaks'], kd_res['heights']):
+                    lines.append(f"N={s}: time={t:.4f}s, {ips:.0f} ins/s, mem_peak={m/1024:.1f} KiB, altura={h}")
             self.text_panel.setPlainText("\n".join(lines))
 
     def eventFilter(self, source, event):
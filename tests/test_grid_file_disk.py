@@ -0,0 +1,103 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import numpy as np
+import pytest
+
+import trees.Grid_file_disk as gfd
+from trees.Grid_file_disk import DiskGridFile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _points(n, seed=0):
+    rng = np.random.default_rng(seed)
+    xs, ys = rng.random(n) * 100, rng.random(n) * 100
+    # puntos repetidos para forzar páginas de desborde
+    xs[:300], ys[:300] = 42.0, 17.0
+    return xs, ys
+
+
+def _brute(xs, ys, window):
+    xmin, xmax, ymin, ymax = window
+    mask = (xs >= xmin) & (xs <= xmax) & (ys >= ymin) & (ys <= ymax)
+    return sorted(np.flatnonzero(mask).tolist())
+
+
+def _check(gf, xs, ys):
+    assert gf.size == len(xs)
+    for window in ((0, 100, 0, 100), (10, 55, 5, 30), (42, 42, 17, 17), (70, 90, 60, 99)):
+        assert sorted(gf.range_query(*window, ids=True)) == _brute(xs, ys, window)
+
+
+def test_reopen_after_process_dies_without_close(tmp_path):
+    path = str(tmp_path / 'pts.grid')
+    xs, ys = _points(5000)
+    script = textwrap.dedent(f"""
+        import os, sys
+        sys.path.insert(0, {ROOT!r})
+        import numpy as np
+        from trees.Grid_file_disk import DiskGridFile
+        rng = np.random.default_rng(0)
+        xs, ys = rng.random(5000) * 100, rng.random(5000) * 100
+        xs[:300], ys[:300] = 42.0, 17.0
+        gf = DiskGridFile.create({path!r}, capacity=16, page_size=512)
+        for i in range(len(xs)):
+            gf.insert(xs[i], ys[i], i)
+        os._exit(0)
+    """)
+    subprocess.run([sys.executable, '-c', script], check=True)
+    with DiskGridFile(path) as gf:
+        _check(gf, xs, ys)
+
+
+def test_crash_during_split_keeps_previous_state(tmp_path, monkeypatch):
+    path = str(tmp_path / 'pts.grid')
+    xs, ys = _points(3000, seed=1)
+    gf = DiskGridFile.create(path, capacity=16, page_size=512)
+    n = 0
+    for n in range(len(xs)):
+        buckets = len(gf.buckets)
+        gf.insert(xs[n], ys[n], n)
+        if n > 1000 and len(gf.buckets) > buckets:
+            break
+    committed = n + 1
+
+    def crash(*args):
+        raise RuntimeError('crash')
+    monkeypatch.setattr(gfd, '_write_header', crash)
+    with pytest.raises(RuntimeError):
+        while True:
+            n += 1
+            gf.insert(xs[n], ys[n], n)
+    monkeypatch.undo()
+
+    # lo insertado después del último commit se pierde o queda, pero nunca se corrompe
+    with DiskGridFile(path) as again:
+        assert committed <= again.size <= n
+        ids = again.range_query(0, 100, 0, 100, ids=True)
+        assert set(range(committed)) <= set(ids)
+        assert len(set(ids)) == len(ids) == again.size
+
+
+def test_free_pages_survive_reopen(tmp_path):
+    path = str(tmp_path / 'pts.grid')
+    xs, ys = _points(2000, seed=2)
+    gf = DiskGridFile.create(path, capacity=16, page_size=512)
+    for i in range(1000):
+        gf.insert(xs[i], ys[i], i)
+    free = sorted(gf.buckets.free_pages())
+    assert free
+    del gf
+
+    gf = DiskGridFile(path)
+    assert sorted(gf.buckets.free_pages()) == free
+    num_pages = gf.buckets.num_pages
+    for i in range(1000, 2000):
+        gf.insert(xs[i], ys[i], i)
+    # las páginas libres se reutilizan antes de crecer el archivo
+    assert gf.buckets.num_pages - num_pages < (2000 - 1000) // 16 + len(free)
+    _check(gf, xs, ys)
+    gf.close()
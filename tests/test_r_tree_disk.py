@@ -0,0 +1,36 @@
+import pytest
+
+from trees.R_tree_disk import HEADER, DiskRTree
+
+
+def _set_policy_code(path, code):
+    with open(path, 'r+b') as f:
+        raw = bytearray(f.read(HEADER.size))
+        fields = list(HEADER.unpack(bytes(raw)))
+        fields[-1] = code
+        f.seek(0)
+        f.write(HEADER.pack(*fields))
+
+
+def test_policy_is_kept_and_open_does_not_write(tmp_path):
+    path = str(tmp_path / 'idx.rtree')
+    DiskRTree.create(path, policy='rstar').close()
+    with open(path, 'rb') as f:
+        before = f.read()
+    tree = DiskRTree(path)
+    assert tree.policy == 'rstar'
+    tree._mm.close()
+    tree._file.close()
+    with open(path, 'rb') as f:
+        assert f.read() == before
+    with pytest.raises(ValueError):
+        DiskRTree(path, policy='linear')
+
+
+@pytest.mark.parametrize('code', [0, 200])
+def test_unknown_policy_code_is_rejected(tmp_path, code):
+    path = str(tmp_path / 'idx.rtree')
+    DiskRTree.create(path).close()
+    _set_policy_code(path, code)
+    with pytest.raises(ValueError):
+        DiskRTree(path)
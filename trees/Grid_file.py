@@ -1,116 +1,350 @@
-from Nodes.Bucket import Bucket
+import math
+from bisect import bisect_right
 
-class GridFile:
-    def __init__(self, capacity=4):
-        # Límites iniciales (una sola celda)
-        self.x_splits = [0, 1]  # rangos de 0 a 1
-        self.y_splits = [0, 1]
+import numpy as np
+
+from Nodes.Bucket import BucketArray
 
+class GridFile:
+    """
+    Grid file clásico (Nievergelt et al.):
+    - escalas lineales `x_splits` / `y_splits` que dividen el dominio en celdas;
+    - `directory`: arreglo entero (nx x ny) con el id del bucket de cada celda;
+    - `buckets`: BucketArray con los puntos (x, y, id de fila) de cada bucket en
+      arreglos de capacidad fija; varias celdas contiguas (una región rectangular
+      de celdas, guardada en `regions[id]` como [i0, i1, j0, j1) semiabiertos)
+      pueden compartir el mismo bucket (`regions` es un arreglo entero con una
+      fila por bucket).
+    Al desbordarse un bucket solo se divide ese bucket; las escalas se refinan
+    únicamente cuando su región ya es una sola celda.
+    El dominio crece solo: un punto fuera de las escalas desplaza el corte
+    exterior correspondiente (la celda del borde se estira hasta incluirlo).
+    """
+    def __init__(self, capacity=4, bounds=None):
         self.capacity = capacity
+        # bounds = (xmin, xmax, ymin, ymax); sin bounds el dominio lo fija el primer punto
+        if bounds is None:
+            self.reset(0, 0, 0, 0)
+            self._has_domain = False
+        else:
+            self.reset(*bounds)
+
+    def reset(self, xmin, xmax, ymin, ymax):
+        """Vacía el grid y lo deja con una sola celda que cubre el dominio dado."""
+        self.x_splits = [xmin, xmax]
+        self.y_splits = [ymin, ymax]
+        self._has_domain = True
+
+        # Directorio (i,j) → id de bucket
+        self.directory = np.zeros((1, 1), dtype=np.int32)
+        self.buckets = self._new_buckets()
+        self.size = 0
+        self._regions = np.empty((4, 4), dtype=np.int32)
+        self._add_bucket((0, 1, 0, 1))
+
+    def _new_buckets(self):
+        """Almacén vacío de buckets (las variantes persistentes lo reemplazan)."""
+        return BucketArray(self.capacity)
+
+    @property
+    def regions(self):
+        return self._regions[:len(self.buckets)]
+
+    def _add_bucket(self, region):
+        b = self.buckets.new()
+        if b == len(self._regions):
+            grown = np.empty((2 * len(self._regions), 4), dtype=np.int32)
+            grown[:b] = self._regions
+            self._regions = grown
+        self._regions[b] = region
+        return b
 
-        # Diccionario (i,j) → bucket
-        self.directory = {(0, 0): Bucket(capacity)}
+    @classmethod
+    def from_points(cls, xs, ys, capacity=4, ids=None):
+        """Construcción en bloque a partir de coordenadas (ids: id de fila de cada
+        punto; por defecto su posición en xs/ys).
+
+        Las escalas se toman de los cuantiles de los datos (no del punto medio
+        geométrico), de modo que cada franja recibe una cantidad parecida de puntos
+        aunque estén agrupados. Los puntos se reparten por celda en una sola pasada
+        vectorizada; en cada columna las celdas contiguas que caben juntas en un
+        bucket lo comparten, y las que aún desbordan se dividen como en `insert`.
+        """
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        gf = cls(capacity=capacity)
+        n = len(xs)
+        ids = np.arange(n, dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64)
+        if n == 0:
+            return gf
+
+        # 1. escalas por cuantiles (~capacity puntos por celda si los ejes fueran independientes)
+        k = max(1, math.ceil(math.sqrt(n / capacity)))
+        qs = np.linspace(0.0, 1.0, k + 1)
+        x_splits = np.unique(np.quantile(xs, qs))
+        y_splits = np.unique(np.quantile(ys, qs))
+        if len(x_splits) == 1:
+            x_splits = np.array([x_splits[0], x_splits[0] + 1.0])
+        if len(y_splits) == 1:
+            y_splits = np.array([y_splits[0], y_splits[0] + 1.0])
+        nx, ny = len(x_splits) - 1, len(y_splits) - 1
+        gf.x_splits = x_splits.tolist()
+        gf.y_splits = y_splits.tolist()
+        gf._has_domain = True
+        gf.size = n
+
+        # 2. celda de cada punto y puntos agrupados por celda (vectorizado)
+        ci = np.clip(np.searchsorted(x_splits, xs, side='right') - 1, 0, nx - 1)
+        cj = np.clip(np.searchsorted(y_splits, ys, side='right') - 1, 0, ny - 1)
+        cell = ci * ny + cj
+        order = np.argsort(cell, kind='stable')
+        counts = np.bincount(cell, minlength=nx * ny).reshape(nx, ny)
+        starts = np.concatenate(([0], np.cumsum(counts.ravel())))
+        sx, sy, sid = xs[order], ys[order], ids[order]
+
+        # 3. un bucket por racha de celdas de una columna que quepan juntas
+        gf.directory = np.empty((nx, ny), dtype=np.int32)
+        gf.buckets = BucketArray(capacity, initial=max(4, 2 * n // capacity))
+        runs = []
+        counts = counts.tolist()
+        for i in range(nx):
+            j = 0
+            while j < ny:
+                j_end, total = j + 1, counts[i][j]
+                while j_end < ny and total + counts[i][j_end] <= capacity:
+                    total += counts[i][j_end]
+                    j_end += 1
+                b = gf._add_bucket((i, i + 1, j, j_end))
+                gf.directory[i, j:j_end] = b
+                runs.append((b, starts[i * ny + j], starts[i * ny + j_end]))
+                j = j_end
+        gf.buckets.fill_many(*zip(*runs), sx, sy, sid)
+
+        # 4. celdas que todavía desbordan (datos correlacionados entre ejes)
+        pending = list(gf.buckets.overflow)
+        while pending:
+            b = pending.pop()
+            if gf.buckets.size(b) <= capacity or not gf._split_bucket(b):
+                continue
+            pending.extend((b, len(gf.buckets) - 1))
+
+        return gf
 
     # --- utilidades internas ---
     def _find_cell(self, x, y):
-        """Encuentra la celda (i,j) del grid donde cae el punto"""
-        i = max([k for k in range(len(self.x_splits)-1) if self.x_splits[k] <= x])
-        j = max([k for k in range(len(self.y_splits)-1) if self.y_splits[k] <= y])
-        return i, j
+        """Encuentra la celda (i,j) del grid donde cae el punto (búsqueda binaria en las escalas)"""
+        return _locate(self.x_splits, x), _locate(self.y_splits, y)
+
+    def _expand(self, x, y):
+        """Estira los cortes exteriores para que (x, y) quede dentro del dominio.
+        Solo cambia la geometría de las celdas del borde; directorio y buckets no se tocan."""
+        if not self._has_domain:
+            self.x_splits = [x, x]
+            self.y_splits = [y, y]
+            self._has_domain = True
+            return
+        if x < self.x_splits[0]:
+            self.x_splits[0] = x
+        elif x > self.x_splits[-1]:
+            self.x_splits[-1] = x
+        if y < self.y_splits[0]:
+            self.y_splits[0] = y
+        elif y > self.y_splits[-1]:
+            self.y_splits[-1] = y
 
     def _split_x(self, i):
-        """Divide la columna i en dos"""
+        """Refina la escala x partiendo la columna i en dos; los buckets no cambian
+        (la columna nueva apunta a los mismos buckets que la original)"""
         mid = (self.x_splits[i] + self.x_splits[i+1]) / 2
         self.x_splits.insert(i+1, mid)
+        self.directory = np.insert(self.directory, i+1, self.directory[i, :], axis=0)
 
-        # redistribuir buckets
-        new_directory = {}
-        for (cx, cy), bucket in self.directory.items():
-            if cx == i:
-                # La celda se divide en dos
-                b1 = Bucket(self.capacity)
-                b2 = Bucket(self.capacity)
-                for (x, y) in bucket.points:
-                    if x < mid:
-                        b1.insert((x, y))
-                    else:
-                        b2.insert((x, y))
-                new_directory[(cx, cy)] = b1
-                new_directory[(cx+1, cy)] = b2
-            elif cx > i:
-                # correr índices hacia la derecha
-                new_directory[(cx+1, cy)] = bucket
-            else:
-                new_directory[(cx, cy)] = bucket
-
-        self.directory = new_directory
+        # regiones a la derecha se desplazan; las que contienen la columna i se ensanchan
+        r = self.regions
+        r[:, 1] += r[:, 1] > i
+        r[:, 0] += r[:, 0] > i
 
     def _split_y(self, j):
-        """Divide la fila j en dos"""
+        """Refina la escala y partiendo la fila j en dos"""
         mid = (self.y_splits[j] + self.y_splits[j+1]) / 2
         self.y_splits.insert(j+1, mid)
+        self.directory = np.insert(self.directory, j+1, self.directory[:, j], axis=1)
+
+        r = self.regions
+        r[:, 3] += r[:, 3] > j
+        r[:, 2] += r[:, 2] > j
+
+    def _can_split(self, splits, k):
+        mid = (splits[k] + splits[k+1]) / 2
+        return splits[k] < mid < splits[k+1]
+
+    def _split_bucket(self, b):
+        """Divide el bucket b en dos por la mitad de su región de celdas.
+        Retorna False si no se puede (celda de tamaño mínimo en ambos ejes)."""
+        i0, i1, j0, j1 = self.regions[b].tolist()
 
-        new_directory = {}
-        for (cx, cy), bucket in self.directory.items():
-            if cy == j:
-                b1 = Bucket(self.capacity)
-                b2 = Bucket(self.capacity)
-                for (x, y) in bucket.points:
-                    if y < mid:
-                        b1.insert((x, y))
-                    else:
-                        b2.insert((x, y))
-                new_directory[(cx, cy)] = b1
-                new_directory[(cx, cy+1)] = b2
-            elif cy > j:
-                new_directory[(cx, cy+1)] = bucket
+        if i1 - i0 == 1 and j1 - j0 == 1:
+            # región de una sola celda: hay que refinar una escala
+            width = self.x_splits[i1] - self.x_splits[i0]
+            height = self.y_splits[j1] - self.y_splits[j0]
+            can_x = self._can_split(self.x_splits, i0)
+            can_y = self._can_split(self.y_splits, j0)
+            if can_x and (width >= height or not can_y):
+                self._split_x(i0)
+            elif can_y:
+                self._split_y(j0)
             else:
-                new_directory[(cx, cy)] = bucket
+                return False
+            i0, i1, j0, j1 = self.regions[b].tolist()
 
-        self.directory = new_directory
+        # dividir por la dimensión que abarca más de una celda (la más extensa si ambas)
+        width = self.x_splits[i1] - self.x_splits[i0]
+        height = self.y_splits[j1] - self.y_splits[j0]
+        if i1 - i0 > 1 and (j1 - j0 == 1 or width >= height):
+            cut = (i0 + i1) // 2
+            self.regions[b] = (i0, cut, j0, j1)
+            b2 = self._add_bucket((cut, i1, j0, j1))
+            self.directory[cut:i1, j0:j1] = b2
+            self.buckets.split(b, b2, 0, self.x_splits[cut])
+        else:
+            cut = (j0 + j1) // 2
+            self.regions[b] = (i0, i1, j0, cut)
+            b2 = self._add_bucket((i0, i1, cut, j1))
+            self.directory[i0:i1, cut:j1] = b2
+            self.buckets.split(b, b2, 1, self.y_splits[cut])
+        return True
 
     # --- operaciones principales ---
-    def insert(self, x, y):
-        i, j = self._find_cell(x, y)
-        bucket = self.directory[(i, j)]
+    def insert(self, x, y, row_id=None):
+        """Inserta el punto (x, y); row_id es el id entero del dato asociado
+        (por defecto, el orden de inserción)."""
+        if row_id is None:
+            row_id = self.size
+        self.size += 1
+        self._expand(x, y)
+        while True:
+            i, j = self._find_cell(x, y)
+            b = int(self.directory[i, j])
 
-        if bucket.insert((x, y)):
-            return
+            if self.buckets.add(b, x, y, row_id):
+                return
 
-        # Bucket lleno → dividir
-        width = self.x_splits[i+1] - self.x_splits[i]
-        height = self.y_splits[j+1] - self.y_splits[j]
+            # Bucket lleno → dividir solo ese bucket y reintentar
+            if not self._split_bucket(b):
+                # puntos idénticos más allá de la precisión: el bucket desborda
+                self.buckets.force(b, x, y, row_id)
+                return
 
-        # dividir la dimensión más grande
-        if width >= height:
-            self._split_x(i)
-        else:
-            self._split_y(j)
+    def range_query(self, xmin, xmax, ymin, ymax, ids=False):
+        """Busca puntos dentro de un rectángulo. Devuelve tuplas (x, y), o los ids
+        de fila de esos puntos si ids=True."""
+        # solo los rangos de índices i/j cuyas celdas intersectan la consulta
+        cols = _index_range(self.x_splits, xmin, xmax)
+        rows = _index_range(self.y_splits, ymin, ymax)
+        if cols is None or rows is None:
+            return []
 
-        # reintentar la inserción
-        self.insert(x, y)
+        # cada bucket compartido se revisa una sola vez, todos en un barrido vectorizado
+        buckets = np.unique(self.directory[cols[0]:cols[1] + 1, rows[0]:rows[1] + 1])
+        xs, ys, row_ids = self.buckets.query(buckets, xmin, xmax, ymin, ymax)
+        if ids:
+            return row_ids.tolist()
+        return list(zip(xs.tolist(), ys.tolist()))
 
-    def range_query(self, xmin, xmax, ymin, ymax):
-        """Busca puntos dentro de un rectángulo"""
-        result = []
-        for (i, j), bucket in self.directory.items():
-            # calcular límites reales de la celda
-            x0, x1 = self.x_splits[i], self.x_splits[i+1]
-            y0, y1 = self.y_splits[j], self.y_splits[j+1]
+    def nearest(self, x, y, k=1):
+        """Los k puntos más cercanos a (x, y) como lista de (id, (x, y), dist), del más
+        cercano al más lejano.
 
-            # si no intersecta, continuar
-            if x1 < xmin or x0 > xmax or y1 < ymin or y0 > ymax:
-                continue
+        Parte de la celda de (x, y) y revisa anillos de celdas cada vez más amplios.
+        Se detiene cuando la k-ésima mejor distancia no supera la distancia de (x, y)
+        al borde de la ventana ya revisada: ningún punto de fuera puede estar más cerca.
+        """
+        if k <= 0 or self.size == 0:
+            return []
+        nx, ny = self.directory.shape
+        xs, ys = self.x_splits, self.y_splits
+        # celda de (x, y), o la del borde más próximo si cae fuera del dominio
+        ci = min(max(bisect_right(xs, x) - 1, 0), nx - 1)
+        cj = min(max(bisect_right(ys, y) - 1, 0), ny - 1)
 
-            # revisar puntos
-            for (x, y) in bucket.points:
-                if xmin <= x <= xmax and ymin <= y <= ymax:
-                    result.append((x, y))
-        return result
+        inf = math.inf
+        visited = set()
+        best_x = best_y = best_d = np.empty(0)
+        best_ids = np.empty(0, dtype=np.int64)
+        r = 0
+        while True:
+            new = list(_ring_buckets(self.directory, ci, cj, r) - visited)
+            if new:
+                visited.update(new)
+                px, py, pid = self.buckets.query(new, -inf, inf, -inf, inf)
+                best_x = np.concatenate((best_x, px))
+                best_y = np.concatenate((best_y, py))
+                best_ids = np.concatenate((best_ids, pid))
+                best_d = np.concatenate((best_d, np.hypot(px - x, py - y)))
+                if len(best_d) > k:
+                    keep = np.argpartition(best_d, k - 1)[:k]
+                    best_x, best_y, best_ids, best_d = best_x[keep], best_y[keep], best_ids[keep], best_d[keep]
+
+            i0, i1 = max(ci - r, 0), min(ci + r, nx - 1)
+            j0, j1 = max(cj - r, 0), min(cj + r, ny - 1)
+            if i0 == 0 and j0 == 0 and i1 == nx - 1 and j1 == ny - 1:
+                break
+            if len(best_d) == k:
+                # distancia al borde de la ventana revisada (los lados en el límite del grid no cuentan)
+                edge = min(x - xs[i0] if i0 > 0 else inf, xs[i1 + 1] - x if i1 < nx - 1 else inf,
+                           y - ys[j0] if j0 > 0 else inf, ys[j1 + 1] - y if j1 < ny - 1 else inf)
+                if best_d.max() <= edge:
+                    break
+            r += 1
+
+        order = np.argsort(best_d, kind='stable')
+        return [(int(best_ids[o]), (float(best_x[o]), float(best_y[o])), float(best_d[o]))
+                for o in order.tolist()]
+
+    def num_points(self):
+        return self.size
 
     def print_grid(self):
         print("Splits X:", self.x_splits)
         print("Splits Y:", self.y_splits)
         print("Directory:")
-        for key, bucket in self.directory.items():
-            print(f"  Cell {key}: {bucket}")
+        print(self.directory)
+        for b in range(len(self.buckets)):
+            print(f"  Bucket {b} {self.regions[b].tolist()}: {self.buckets.points(b)}")
+
+
+def _locate(splits, v):
+    """Índice k de la franja [splits[k], splits[k+1]) que contiene v; los valores por
+    encima del último corte caen en la última franja."""
+    k = bisect_right(splits, v) - 1
+    if k < 0:
+        raise ValueError(f"{v} está por debajo del dominio del grid ({splits[0]})")
+    return min(k, len(splits) - 2)
+
+
+def _ring_buckets(directory, ci, cj, r):
+    """Conjunto de ids de bucket de las celdas a distancia de Chebyshev exactamente r de (ci, cj)."""
+    nx, ny = directory.shape
+    i0, i1 = max(ci - r, 0), min(ci + r, nx - 1)
+    j0, j1 = max(cj - r, 0), min(cj + r, ny - 1)
+    parts = []
+    if ci - r >= 0:
+        parts.append(directory[ci - r, j0:j1 + 1])
+    if r > 0 and ci + r < nx:
+        parts.append(directory[ci + r, j0:j1 + 1])
+    if cj - r >= 0:
+        parts.append(directory[i0:i1 + 1, cj - r])
+    if r > 0 and cj + r < ny:
+        parts.append(directory[i0:i1 + 1, cj + r])
+    if not parts:
+        return set()
+    return set(np.concatenate(parts).tolist())
+
+
+def _index_range(splits, lo, hi):
+    """Rango inclusivo (k0, k1) de franjas que intersectan [lo, hi], o None."""
+    if hi < splits[0] or lo > splits[-1]:
+        return None
+    k0 = max(bisect_right(splits, lo) - 1, 0)
+    k1 = min(bisect_right(splits, hi) - 1, len(splits) - 2)
+    return min(k0, len(splits) - 2), k1
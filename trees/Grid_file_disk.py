@@ -0,0 +1,405 @@
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from .Grid_file import GridFile
+from .buffer_pool import BufferPool
+
+# ===========================================
+#   Grid file en disco: directorio en cabecera + una página por bucket
+# ===========================================
+#
+# `<path>.dir` (cabecera, se reemplaza entera y de forma atómica en cada commit):
+#     magic, page_size, capacity, has_domain, nx, ny, num_buckets, num_pages, num_free
+#     x_splits float64[nx+1], y_splits float64[ny+1], directory int32[nx*ny],
+#     regions int32[num_buckets*4], primera página de cada bucket int64[num_buckets],
+#     páginas libres int64[num_free]
+# `<path>` (datos, páginas de `page_size` bytes accedidas con mmap):
+#     [count u16][pad 6 bytes][next int64]
+#     [capacity x float64 x][capacity x float64 y][capacity x int64 id]
+#
+# Una búsqueda exacta cuesta un acceso al directorio (en memoria) y uno a la página
+# del bucket. `next` encadena páginas de desborde (solo con puntos idénticos que
+# no se pueden separar); -1 si no hay.
+#
+# Consistencia: las páginas que referencia la última cabecera escrita solo se
+# modifican agregando un punto a una página con lugar. Todo cambio estructural
+# (dividir, desbordar, crear buckets, mover escalas) escribe páginas nuevas y
+# termina reemplazando la cabecera; las páginas viejas pasan a la lista libre en
+# ese mismo reemplazo. Si el proceso muere sin close(), al reabrir la cabecera
+# describe un estado completo (a lo sumo sin el último cambio estructural en curso).
+# El número de puntos se recuenta desde las páginas al abrir.
+
+MAGIC = b'GRIDPG02'
+HEADER = struct.Struct('<8sIII4xqqqqq')
+PAGE_HEADER = struct.Struct('<H6xq')
+POINT_BYTES = 3 * 8
+DEFAULT_PAGE_SIZE = 4096
+
+
+class DiskBucket:
+    """ Página decodificada: arreglos de capacidad fija, `count` ocupados """
+    __slots__ = ('count', 'next', 'xs', 'ys', 'ids')
+
+    def __init__(self, count, next_page, xs, ys, ids):
+        self.count = count
+        self.next = next_page
+        self.xs = xs
+        self.ys = ys
+        self.ids = ids
+
+
+class DiskBucketArray:
+    """ Almacén de buckets paginado con la misma interfaz que BucketArray.
+
+    Las páginas se leen a través de un BufferPool LRU y se escriben de inmediato
+    en el mmap. Los cambios estructurales son copy-on-write: las páginas que
+    dejan de usarse esperan en `_pending_free` hasta el próximo commit de la
+    cabecera (`committed`) y `dirty` indica que hay uno pendiente.
+    """
+
+    def __init__(self, path, page_size, capacity, pages, num_pages, free=(), cache_pages=64):
+        self.path = path
+        self.page_size = page_size
+        self.capacity = capacity
+        self.pages = list(pages)
+        self.num_pages = num_pages
+        self._free = list(free)
+        self._pending_free = []
+        self.dirty = False
+        self._file = open(path, 'r+b')
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+        self.pool = BufferPool(cache_pages, self._read_page)
+
+    def __len__(self):
+        return len(self.pages)
+
+    # --- páginas ---
+    def _read_page(self, page_id):
+        off = page_id * self.page_size
+        count, next_page = PAGE_HEADER.unpack_from(self._mm, off)
+        off += PAGE_HEADER.size
+        cols = []
+        for dtype in (np.float64, np.float64, np.int64):
+            cols.append(np.frombuffer(self._mm, dtype=dtype, count=self.capacity, offset=off).copy())
+            off += self.capacity * 8
+        return DiskBucket(count, next_page, *cols)
+
+    def _write_page(self, page_id, page):
+        off = page_id * self.page_size
+        self._mm[off:off + self.page_size] = _encode(page).ljust(self.page_size, b'\0')
+        self.pool.put(page_id, page)
+
+    def _allocate_page(self):
+        self.dirty = True
+        if self._free:
+            return self._free.pop()
+        page_id = self.num_pages
+        self.num_pages += 1
+        needed = self.num_pages * self.page_size
+        if needed > len(self._mm):
+            # crecer el archivo al doble y volver a mapearlo
+            new_size = max(needed, 2 * len(self._mm))
+            self._mm.close()
+            self._file.truncate(new_size)
+            self._mm = mmap.mmap(self._file.fileno(), 0)
+        return page_id
+
+    def _empty_page(self):
+        return DiskBucket(0, -1, np.zeros(self.capacity), np.zeros(self.capacity),
+                          np.zeros(self.capacity, dtype=np.int64))
+
+    def _chain(self, b):
+        """Pares (página, DiskBucket) del bucket b, primero la principal."""
+        page_id = self.pages[b]
+        while page_id >= 0:
+            page = self.pool.get(page_id)
+            yield page_id, page
+            page_id = page.next
+
+    # --- interfaz de BucketArray ---
+    def new(self):
+        page_id = self._allocate_page()
+        self._write_page(page_id, self._empty_page())
+        self.pages.append(page_id)
+        return len(self.pages) - 1
+
+    def clear(self):
+        # las páginas en uso siguen siendo de la cabecera anterior hasta el commit
+        self.pool.clear()
+        self._pending_free = sorted(set(range(self.num_pages)) - set(self._free))
+        self.pages = []
+        self.dirty = True
+
+    def free_pages(self):
+        """Páginas libres según la próxima cabecera (incluye las liberadas desde
+        el último commit)."""
+        return self._free + self._pending_free
+
+    def committed(self):
+        """La cabecera ya no referencia las páginas liberadas: pueden reutilizarse."""
+        self._free.extend(self._pending_free)
+        self._pending_free = []
+        self.dirty = False
+
+    def size(self, b):
+        return sum(page.count for _, page in self._chain(b))
+
+    def add(self, b, x, y, row_id):
+        page_id = self.pages[b]
+        page = self.pool.get(page_id)
+        if page.count >= self.capacity:
+            return False
+        _append(page, x, y, row_id)
+        self._write_page(page_id, page)
+        return True
+
+    def force(self, b, x, y, row_id):
+        for page_id, page in self._chain(b):
+            pass
+        if page.count < self.capacity:
+            _append(page, x, y, row_id)
+            self._write_page(page_id, page)
+            return
+        # hace falta una página de desborde: la cadena se reescribe copy-on-write
+        xs, ys, ids = self.entries(b)
+        self.fill(b, np.append(xs, x), np.append(ys, y), np.append(ids, row_id))
+
+    def fill(self, b, xs, ys, ids):
+        """Reemplaza el contenido del bucket b escribiendo una cadena nueva; la
+        anterior se libera en el próximo commit."""
+        xs, ys, ids = np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64), np.asarray(ids, dtype=np.int64)
+        old = [page_id for page_id, _ in self._chain(b)]
+        chunks = max(1, -(-len(xs) // self.capacity))
+        new = [self._allocate_page() for _ in range(chunks)]
+        for k in range(chunks):
+            lo, hi = k * self.capacity, min((k + 1) * self.capacity, len(xs))
+            page = self._empty_page()
+            page.count = hi - lo
+            page.xs[:hi - lo], page.ys[:hi - lo], page.ids[:hi - lo] = xs[lo:hi], ys[lo:hi], ids[lo:hi]
+            page.next = new[k + 1] if k + 1 < chunks else -1
+            self._write_page(new[k], page)
+        self.pages[b] = new[0]
+        self._pending_free.extend(old)
+
+    def entries(self, b):
+        parts = [(p.xs[:p.count], p.ys[:p.count], p.ids[:p.count]) for _, p in self._chain(b)]
+        if len(parts) == 1:
+            return parts[0]
+        return tuple(np.concatenate(col) for col in zip(*parts))
+
+    def points(self, b):
+        xs, ys, _ = self.entries(b)
+        return list(zip(xs.tolist(), ys.tolist()))
+
+    def split(self, b, b2, axis, bound):
+        xs, ys, ids = (col.copy() for col in self.entries(b))
+        low = (xs if axis == 0 else ys) < bound
+        self.fill(b, xs[low], ys[low], ids[low])
+        self.fill(b2, xs[~low], ys[~low], ids[~low])
+
+    def query(self, buckets, xmin, xmax, ymin, ymax):
+        parts = [self.entries(b) for b in np.asarray(buckets).tolist()]
+        if not parts:
+            empty = np.empty(0)
+            return empty, empty, np.empty(0, dtype=np.int64)
+        xs, ys, ids = (np.concatenate(col) for col in zip(*parts))
+        mask = (xs >= xmin) & (xs <= xmax) & (ys >= ymin) & (ys <= ymax)
+        return xs[mask], ys[mask], ids[mask]
+
+    def num_points(self):
+        """Puntos en todos los buckets, leyendo solo las cabeceras de página del mmap."""
+        if not self.pages:
+            return 0
+        # vistas con paso page_size sobre count (u16, byte 0) y next (int64, byte 8)
+        counts = np.ndarray((self.num_pages,), dtype='<u2', buffer=self._mm, strides=(self.page_size,)).astype(np.int64)
+        nexts = np.ndarray((self.num_pages,), dtype='<i8', buffer=self._mm, offset=8, strides=(self.page_size,)).copy()
+        heads = np.asarray(self.pages, dtype=np.int64)
+        total = int(counts[heads].sum())
+        for page_id in nexts[heads][nexts[heads] >= 0].tolist():
+            while page_id >= 0:
+                total += int(counts[page_id])
+                page_id = int(nexts[page_id])
+        return total
+
+    # --- ciclo de vida ---
+    def flush(self):
+        self._mm.flush()
+
+    def close(self):
+        if not self._mm.closed:
+            self._mm.flush()
+            self.pool.clear()
+            self._mm.close()
+            self._file.close()
+
+
+class DiskGridFile(GridFile):
+    """
+    GridFile persistente: las escalas, el directorio y las regiones viven en una
+    cabecera pequeña (`<path>.dir`, cargada entera en memoria) y cada bucket es una
+    página de tamaño fijo en el archivo de datos `<path>`, leída a través de un
+    BufferPool LRU de `cache_pages` páginas con contadores de aciertos/fallos.
+
+    La lógica de inserción, división y consulta es la de GridFile; solo cambia el
+    almacén de buckets. Los ids de fila apuntan a los datos, que viven fuera del índice.
+    """
+
+    def __init__(self, path, cache_pages=64):
+        self.path = path
+        with open(_header_path(path), 'rb') as f:
+            raw = f.read()
+        (magic, page_size, capacity, has_domain,
+         nx, ny, num_buckets, num_pages, num_free) = HEADER.unpack_from(raw, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} no es un archivo de DiskGridFile")
+        off = HEADER.size
+        arrays = []
+        for dtype, count in ((np.float64, nx + 1), (np.float64, ny + 1), (np.int32, nx * ny),
+                             (np.int32, num_buckets * 4), (np.int64, num_buckets), (np.int64, num_free)):
+            arrays.append(np.frombuffer(raw, dtype=dtype, count=count, offset=off).copy())
+            off += count * np.dtype(dtype).itemsize
+        x_splits, y_splits, directory, regions, pages, free = arrays
+
+        self.capacity = capacity
+        self.page_size = page_size
+        self.x_splits = x_splits.tolist()
+        self.y_splits = y_splits.tolist()
+        self._has_domain = bool(has_domain)
+        self.directory = directory.reshape(nx, ny)
+        self._regions = np.empty((max(4, num_buckets), 4), dtype=np.int32)
+        self._regions[:num_buckets] = regions.reshape(num_buckets, 4)
+        self.buckets = DiskBucketArray(path, page_size, capacity, pages.tolist(), num_pages,
+                                       free.tolist(), cache_pages)
+        self.size = self.buckets.num_points()
+
+    def _new_buckets(self):
+        # reset(): se reutiliza el archivo, descartando todas las páginas
+        self.buckets.clear()
+        return self.buckets
+
+    def reset(self, xmin, xmax, ymin, ymax):
+        super().reset(xmin, xmax, ymin, ymax)
+        self._commit()
+
+    def _expand(self, x, y):
+        before = (self._has_domain, self.x_splits[0], self.x_splits[-1], self.y_splits[0], self.y_splits[-1])
+        super()._expand(x, y)
+        if before != (self._has_domain, self.x_splits[0], self.x_splits[-1], self.y_splits[0], self.y_splits[-1]):
+            # las escalas nuevas se publican antes de escribir el punto fuera del dominio anterior
+            self._commit()
+
+    def insert(self, x, y, row_id=None):
+        super().insert(x, y, row_id)
+        if self.buckets.dirty:
+            self._commit()
+
+    def _commit(self):
+        """Reemplaza la cabecera por la del estado actual y libera las páginas que
+        la anterior todavía referenciaba."""
+        _write_header(self.path, self, self.buckets.pages, self.buckets.num_pages,
+                      self.buckets.free_pages(), self.page_size)
+        self.buckets.committed()
+
+    # --- creación ---
+    @classmethod
+    def create(cls, path, capacity=None, page_size=DEFAULT_PAGE_SIZE, bounds=None, cache_pages=64):
+        """Crea un grid vacío en disco (capacity por defecto: lo que cabe en una página)."""
+        capacity = _check_capacity(page_size, capacity)
+        _write_files(path, GridFile(capacity=capacity, bounds=bounds), page_size)
+        return cls(path, cache_pages=cache_pages)
+
+    @classmethod
+    def bulk_create(cls, path, xs, ys, ids=None, capacity=None, page_size=DEFAULT_PAGE_SIZE, cache_pages=64):
+        """Crea el archivo con escalas por cuantiles (ver GridFile.from_points)."""
+        capacity = _check_capacity(page_size, capacity)
+        _write_files(path, GridFile.from_points(xs, ys, capacity=capacity, ids=ids), page_size)
+        return cls(path, cache_pages=cache_pages)
+
+    @classmethod
+    def from_points(cls, xs, ys, capacity=4, ids=None):
+        raise TypeError("DiskGridFile necesita una ruta: usar DiskGridFile.bulk_create(path, xs, ys)")
+
+    # --- ciclo de vida ---
+    def stats(self):
+        info = self.buckets.pool.stats()
+        info.update({'pages': self.buckets.num_pages, 'page_size': self.page_size,
+                     'buckets': len(self.buckets), 'cells': int(self.directory.size), 'size': self.size})
+        return info
+
+    def flush(self):
+        self._commit()
+        self.buckets.flush()
+
+    def close(self):
+        if not self.buckets._mm.closed:
+            self.flush()
+            self.buckets.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _header_path(path):
+    return path + '.dir'
+
+
+def _check_capacity(page_size, capacity):
+    fit = (page_size - PAGE_HEADER.size) // POINT_BYTES
+    if capacity is None:
+        capacity = fit
+    if capacity < 1 or capacity > fit:
+        raise ValueError(f"capacity debe estar entre 1 y {fit} para page_size={page_size}")
+    return capacity
+
+
+def _append(page, x, y, row_id):
+    c = page.count
+    page.xs[c], page.ys[c], page.ids[c] = x, y, row_id
+    page.count = c + 1
+
+
+def _encode(page):
+    return PAGE_HEADER.pack(page.count, page.next) + page.xs.tobytes() + page.ys.tobytes() + page.ids.tobytes()
+
+
+def _write_header(path, gf, pages, num_pages, free, page_size):
+    nx, ny = gf.directory.shape
+    parts = [HEADER.pack(MAGIC, page_size, gf.capacity, int(gf._has_domain),
+                         nx, ny, len(pages), num_pages, len(free)),
+             np.asarray(gf.x_splits, dtype=np.float64).tobytes(),
+             np.asarray(gf.y_splits, dtype=np.float64).tobytes(),
+             np.ascontiguousarray(gf.directory, dtype=np.int32).tobytes(),
+             np.ascontiguousarray(gf.regions, dtype=np.int32).tobytes(),
+             np.asarray(pages, dtype=np.int64).tobytes(),
+             np.asarray(free, dtype=np.int64).tobytes()]
+    # escribir aparte y reemplazar, para no dejar una cabecera a medias
+    tmp = _header_path(path) + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(b''.join(parts))
+    os.replace(tmp, _header_path(path))
+
+
+def _write_files(path, gf, page_size):
+    """Vuelca un GridFile en memoria a cabecera + páginas (una o más por bucket)."""
+    capacity = gf.capacity
+    pages = []
+    num_pages = 0
+    with open(path, 'wb') as f:
+        for b in range(len(gf.buckets)):
+            xs, ys, ids = gf.buckets.entries(b)
+            chunks = max(1, -(-len(xs) // capacity))
+            pages.append(num_pages)
+            for k in range(chunks):
+                lo, hi = k * capacity, min((k + 1) * capacity, len(xs))
+                page = DiskBucket(hi - lo, num_pages + 1 if k + 1 < chunks else -1,
+                                  np.zeros(capacity), np.zeros(capacity), np.zeros(capacity, dtype=np.int64))
+                page.xs[:hi - lo], page.ys[:hi - lo], page.ids[:hi - lo] = xs[lo:hi], ys[lo:hi], ids[lo:hi]
+                f.write(_encode(page).ljust(page_size, b'\0'))
+                num_pages += 1
+    _write_header(path, gf, pages, num_pages, [], page_size)
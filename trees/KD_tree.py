@@ -1,20 +1,344 @@
+import math
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+from multiprocessing import shared_memory
+
 import numpy as np
 
-from Nodes.KD_node import AdaptiveKDNode
+from Nodes.KD_node import AdaptiveKDNode, plan_subtree
+from Nodes.R_tree.Geometry_Utils import prepare_polygon
+from .KD_tree_static import StaticKDTree
+
+EXECUTORS = ('thread', 'process')
+# por debajo de esto la construcción en paralelo no compensa el arranque del pool
+PARALLEL_MIN_POINTS = 20000
+# radio medio de la Tierra (m), para el modo geodésico
+EARTH_RADIUS = 6371008.8
+
 
 class AdaptiveKDTree:
-    def __init__(self, points=None):
+    def __init__(self, points=None, workers=None, geodesic=False):
+        # workers > 1: construye los subárboles independientes en un pool de procesos
+        # geodesic: los puntos son [lon, lat] en grados; se guardan como vectores
+        # unitarios 3D y las distancias se devuelven en metros (haversine)
+        self.geodesic = geodesic
         self.root = None
-        if points:
-            self.root = AdaptiveKDNode(points)
+        # copia plana de los puntos en orden de inserción: query/query_radius devuelven
+        # índices sobre este orden (vectores 3D en modo geodésico)
+        self._coords = np.empty((0, 3 if geodesic else 2))
+        # en modo geodésico, también los [lon, lat] originales en el mismo orden: las
+        # consultas por área filtran y devuelven estos, sin pasar por los vectores
+        self._lonlat = np.empty((0, 2))
+        self._count = 0
+        self._static = None
+        if points is not None and len(points):
+            self._coords = np.array(points, dtype=np.float64).reshape(len(points), -1)
+            if geodesic:
+                self._lonlat = self._coords
+                self._coords = points = lonlat_to_unit(self._coords)
+            self._count = len(self._coords)
+            if workers and workers > 1 and self._count >= PARALLEL_MIN_POINTS:
+                self.root = _parallel_build(self._coords, workers)
+            else:
+                self.root = AdaptiveKDNode(points)
 
     def insert(self, point):
-        point = np.array(point)
+        original = np.asarray(point, dtype=np.float64)
+        point = self._embed(original)
+        # primero las copias planas: si el punto no encaja, el árbol queda intacto
+        if self._count == len(self._coords):
+            # sin puntos, la dimensión la fija el primero
+            dim = self._coords.shape[1] if self._count else len(point)
+            self._coords = _grow(self._coords, self._count, dim)
+            if self.geodesic:
+                self._lonlat = _grow(self._lonlat, self._count, 2)
+        self._coords[self._count] = point
+        if self.geodesic:
+            self._lonlat[self._count] = original
+        index = self._count
+        self._count += 1
+        self._static = None
+
         if self.root is None:
-            self.root = AdaptiveKDNode([point])
+            self.root = AdaptiveKDNode([point], ids=[index])
         else:
-            self.root.insert(point)
+            self.root.insert(point, index)
+
+    def __len__(self):
+        return self.root.size if self.root is not None else 0
 
     def nearest(self, point):
-        point = np.array(point)
-        return self.root.nearest_neighbor(point)
+        """Retorna (punto, distancia). En modo geodésico el punto vuelve como
+        [lon, lat] y la distancia en metros."""
+        best, dist = self.root.nearest_neighbor(self._embed(point))
+        if self.geodesic and best is not None:
+            return unit_to_lonlat(best), chord_to_metres(dist)
+        return best, dist
+
+    # --- consultas por área ---
+    def range_query(self, xmin, ymin, xmax, ymax):
+        """Puntos dentro del rectángulo (inclusive), como arreglo (m x 2); en modo
+        geodésico el rectángulo y los puntos están en [lon, lat]."""
+        lo = np.array([xmin, ymin], dtype=np.float64)
+        hi = np.array([xmax, ymax], dtype=np.float64)
+        if self._count == 0:
+            return np.empty((0, 2))
+        if self.geodesic:
+            accepted, candidates = self._box_search(*lonlat_box_to_unit(xmin, ymin, xmax, ymax))
+        else:
+            accepted, candidates = self._box_search(
+                lo, hi, lambda los, his: (los >= lo).all(axis=1) & (his <= hi).all(axis=1))
+        points = self._points()
+        candidates = points[candidates]
+        inside = ((candidates >= lo) & (candidates <= hi)).all(axis=1)
+        return np.vstack([points[accepted], candidates[inside]])
+
+    def intersect_polygon(self, polygon):
+        """Puntos dentro del polígono (o sobre su borde), como arreglo (m x 2).
+
+        Poda con el MBR del polígono; los subárboles cuya caja queda dentro del
+        polígono se reportan enteros y el resto se filtra con PreparedPolygon."""
+        prepared = prepare_polygon(polygon)
+        xmin, ymin, xmax, ymax = prepared.bounds
+        if self._count == 0:
+            return np.empty((0, 2))
+        if self.geodesic:
+            accepted, candidates = self._box_search(*lonlat_box_to_unit(xmin, ymin, xmax, ymax))
+        else:
+            accepted, candidates = self._box_search(
+                np.array([xmin, ymin]), np.array([xmax, ymax]),
+                lambda los, his: prepared.contains_rects(np.hstack([los, his])))
+        points = self._points()
+        candidates = points[candidates]
+        # cada candidato como rectángulo degenerado
+        inside = prepared.intersects_rects(np.hstack([candidates, candidates]))
+        return np.vstack([points[accepted], candidates[inside]])
+
+    def _box_search(self, lo, hi, contains=None):
+        """Recorre el árbol por niveles podando con la caja [lo, hi] (en el espacio
+        del árbol) y las cajas de los nodos; cada nivel se clasifica vectorizado.
+
+        Retorna (accepted, candidates), ids de los puntos (orden de inserción): los
+        de subárboles que contains(los, his) da por completamente dentro de la
+        consulta, sin test por punto, y los que necesitan el test exacto. Sin
+        contains, los subárboles dentro de la caja pasan enteros a candidatos.
+        """
+        accepted, candidates = [], []
+        frontier = [self.root] if self.root is not None else []
+        while frontier:
+            los = np.array([node.lo for node in frontier])
+            his = np.array([node.hi for node in frontier])
+            overlap = (his >= lo).all(axis=1) & (los <= hi).all(axis=1)
+            within = (los >= lo).all(axis=1) & (his <= hi).all(axis=1)
+            done = contains(los, his) & overlap if contains else np.zeros(len(frontier), dtype=bool)
+
+            next_frontier = []
+            for node, o, w, d in zip(frontier, overlap.tolist(), within.tolist(), done.tolist()):
+                if not o:
+                    continue
+                if d:
+                    accepted.extend(node.collect_ids())
+                elif w:
+                    candidates.extend(node.collect_ids())
+                else:
+                    candidates.append(node.id)
+                    if node.left:  next_frontier.append(node.left)
+                    if node.right: next_frontier.append(node.right)
+            frontier = next_frontier
+        return np.array(accepted, dtype=np.int64), np.array(candidates, dtype=np.int64)
+
+    def _points(self):
+        """Puntos en orden de inserción, en las coordenadas del usuario."""
+        return (self._lonlat if self.geodesic else self._coords)[:self._count]
+
+    def _embed(self, points):
+        """Coordenadas en el espacio del árbol: vectores unitarios 3D en modo geodésico."""
+        points = np.asarray(points, dtype=np.float64)
+        return lonlat_to_unit(points) if self.geodesic else points
+
+    # --- consultas en lote ---
+    def _snapshot(self):
+        """StaticKDTree con los puntos actuales; se reconstruye tras cada inserción,
+        una sola vez por lote de consultas."""
+        if self._static is None:
+            self._static = StaticKDTree(self._coords[:self._count])
+            self._static._leaf_blocks()
+        return self._static
+
+    def query(self, points, k=1, workers=None, executor='thread', chunk_size=2048):
+        """k vecinos más cercanos de cada fila de `points` (m x 2).
+        Retorna (idx, dists), arreglos (m, k) ordenados por distancia, en el mismo
+        orden que query_radius; idx son índices en el orden de inserción de los puntos.
+        k se limita al número de puntos: con el árbol vacío los arreglos son (m, 0).
+
+        Las consultas se resuelven vectorizadas sobre una instantánea estática del
+        árbol (StaticKDTree.batch_query). Con workers > 1 los trozos de chunk_size
+        consultas se reparten en un pool de hilos o de procesos (executor).
+        """
+        tree = self._snapshot()
+        qs = self._embed(np.asarray(points, dtype=np.float64).reshape(-1, 2 if self.geodesic else self._coords.shape[1]))
+        parts = _run_chunks(tree, 'batch_query', qs, k, workers, executor, chunk_size)
+        if len(parts) == 1:
+            idx, dists = parts[0]
+        else:
+            idx, dists = np.vstack([i for i, _ in parts]), np.vstack([d for _, d in parts])
+        if self.geodesic:
+            dists = chord_to_metres(dists)
+        return idx, dists
+
+    def query_radius(self, points, r, workers=None, executor='thread', chunk_size=2048):
+        """Vecinos a distancia <= r de cada fila de `points`.
+        Retorna (idx, dists): listas con un arreglo por consulta, ordenado por distancia.
+        En modo geodésico r y las distancias están en metros."""
+        tree = self._snapshot()
+        qs = self._embed(np.asarray(points, dtype=np.float64).reshape(-1, 2 if self.geodesic else self._coords.shape[1]))
+        if self.geodesic:
+            r = metres_to_chord(r)
+        parts = _run_chunks(tree, 'batch_query_radius', qs, r, workers, executor, chunk_size)
+        idx, dists = [], []
+        for i, d in parts:
+            idx.extend(i)
+            dists.extend([chord_to_metres(x) for x in d] if self.geodesic else d)
+        return idx, dists
+
+
+# --- modo geodésico ---
+# La distancia de cuerda entre vectores unitarios crece con la distancia sobre la
+# esfera, así que el árbol busca con distancia euclídea 3D (poda por eje incluida)
+# y solo el resultado se convierte a metros.
+def lonlat_to_unit(points):
+    """[lon, lat] en grados (... x 2) -> vectores unitarios (... x 3)."""
+    points = np.asarray(points, dtype=np.float64)
+    lon = np.radians(points[..., 0])
+    lat = np.radians(points[..., 1])
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def unit_to_lonlat(vectors):
+    """Inverso de lonlat_to_unit."""
+    vectors = np.asarray(vectors, dtype=np.float64)
+    lon = np.degrees(np.arctan2(vectors[..., 1], vectors[..., 0]))
+    lat = np.degrees(np.arcsin(np.clip(vectors[..., 2], -1.0, 1.0)))
+    return np.stack([lon, lat], axis=-1)
+
+
+def lonlat_box_to_unit(xmin, ymin, xmax, ymax):
+    """Caja 3D (lo, hi) que contiene los vectores unitarios de todo el rectángulo
+    [xmin, xmax] x [ymin, ymax] en grados (cota conservadora, para podar)."""
+    lat = np.radians([ymin, ymax])
+    lon = np.radians([xmin, xmax])
+    # extremos de cos/sin de la longitud: bordes y múltiplos de 90° dentro del rango
+    quarter = np.arange(np.ceil(xmin / 90.0), np.floor(xmax / 90.0) + 1) * (np.pi / 2)
+    lons = np.concatenate([lon, quarter])
+    cos_lon, sin_lon = np.cos(lons), np.sin(lons)
+    cos_lat = np.cos(lat)
+    cos_lat = [cos_lat.min(), 1.0 if ymin <= 0.0 <= ymax else cos_lat.max()]
+    xs = np.outer(cos_lat, [cos_lon.min(), cos_lon.max()])
+    ys = np.outer(cos_lat, [sin_lon.min(), sin_lon.max()])
+    zs = np.sin(lat)
+    return (np.array([xs.min(), ys.min(), zs.min()]),
+            np.array([xs.max(), ys.max(), zs.max()]))
+
+
+def chord_to_metres(chord):
+    """Distancia de cuerda (esfera unitaria) -> distancia de gran círculo en metros;
+    equivale a haversine."""
+    return 2.0 * EARTH_RADIUS * np.arcsin(np.clip(np.asarray(chord) / 2.0, 0.0, 1.0))
+
+
+def metres_to_chord(metres):
+    """Distancia de gran círculo en metros -> distancia de cuerda."""
+    return 2.0 * np.sin(np.minimum(np.asarray(metres) / (2.0 * EARTH_RADIUS), np.pi / 2))
+
+
+def _grow(array, count, dim):
+    """Copia de las primeras `count` filas en un arreglo del doble de filas."""
+    grown = np.empty((max(4, 2 * count), dim))
+    grown[:count] = array[:count]
+    return grown
+
+
+def _parallel_build(coords, workers):
+    """Construye el árbol con las mismas dos fases que AdaptiveKDNode.build, pero
+    planificando en paralelo.
+
+    El proceso principal planifica los primeros niveles; los subárboles que quedan
+    (unos 4 por worker) son rangos disjuntos de los mismos arreglos, que viven en
+    memoria compartida: cada worker los planifica en su lugar sin copiar coordenadas
+    ni devolver resultados. Al final se crean los nodos en el proceso principal.
+    """
+    n = len(coords)
+    specs = {'coords': (coords.shape, np.float64), 'idx': ((n,), np.int64),
+             'order': ((n,), np.int64), 'axes': ((n,), np.int8), 'nleft': ((n,), np.int64)}
+    blocks = {}
+    try:
+        arrays = {}
+        for name, (shape, dtype) in specs.items():
+            blocks[name] = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize))
+            arrays[name] = np.ndarray(shape, dtype=dtype, buffer=blocks[name].buf)
+        arrays['coords'][:] = coords
+        arrays['idx'][:] = np.arange(n)
+
+        pending = []
+        levels = math.ceil(math.log2(workers)) + 2
+        plan_subtree(arrays['coords'], arrays['idx'], 0, n, 0, arrays['order'], arrays['axes'],
+                     arrays['nleft'], max_depth=levels, pending=pending)
+
+        layout = {name: (blocks[name].name,) + specs[name] for name in specs}
+        with ProcessPoolExecutor(workers) as pool:
+            for _ in pool.map(_plan_shared, repeat(layout), pending):
+                pass
+
+        order, axes, nleft = arrays['order'].copy(), arrays['axes'].copy(), arrays['nleft'].copy()
+        del arrays
+    finally:
+        for block in blocks.values():
+            block.close()
+            block.unlink()
+
+    root = AdaptiveKDNode()
+    root.assemble(coords[order], axes, nleft, order)
+    return root
+
+
+def _plan_shared(layout, task):
+    """Worker: planifica un subárbol (s, e, pos) sobre los arreglos compartidos."""
+    s, e, pos = task
+    blocks = [shared_memory.SharedMemory(name=name) for name, _, _ in layout.values()]
+    try:
+        arrays = {key: np.ndarray(shape, dtype=dtype, buffer=block.buf)
+                  for (key, (_, shape, dtype)), block in zip(layout.items(), blocks)}
+        plan_subtree(arrays['coords'], arrays['idx'], s, e, pos,
+                     arrays['order'], arrays['axes'], arrays['nleft'])
+        del arrays
+    finally:
+        for block in blocks:
+            block.close()
+
+
+def _run_chunks(tree, method, qs, arg, workers, executor, chunk_size):
+    """Aplica tree.<method>(trozo, arg) a trozos de qs, en serie o en un pool."""
+    if executor not in EXECUTORS:
+        raise ValueError(f"executor debe ser uno de {EXECUTORS}")
+    if not workers or workers <= 1 or len(qs) <= chunk_size:
+        return [getattr(tree, method)(qs, arg)]
+    chunks = [qs[i:i + chunk_size] for i in range(0, len(qs), chunk_size)]
+    if executor == 'process':
+        # el árbol se envía una vez a cada proceso, no con cada trozo
+        with ProcessPoolExecutor(workers, initializer=_set_worker_tree, initargs=(tree,)) as pool:
+            return list(pool.map(_worker_call, repeat(method), chunks, repeat(arg)))
+    with ThreadPoolExecutor(workers) as pool:
+        return list(pool.map(getattr(tree, method), chunks, repeat(arg)))
+
+
+_worker_tree = None
+
+
+def _set_worker_tree(tree):
+    global _worker_tree
+    _worker_tree = tree
+
+
+def _worker_call(method, chunk, arg):
+    return getattr(_worker_tree, method)(chunk, arg)
@@ -0,0 +1,302 @@
+import numpy as np
+
+# ===========================================
+#   KD-Tree estático implícito (arreglos planos)
+# ===========================================
+#
+# Nodo k:  axis[k], split[k]     eje y valor de corte (solo nodos internos)
+#          left[k], right[k]     índices de los hijos, -1 en las hojas
+#          start[k], end[k]      rango [start, end) del nodo en `points` (permutado)
+#          lo[k], hi[k]          caja envolvente de los puntos del nodo
+#
+# `points` es una copia permutada de los puntos de entrada y `ids[i]` la posición
+# original de points[i]; cada subárbol ocupa un rango contiguo, así que una hoja
+# (bucket de hasta leaf_size puntos) se revisa con una sola operación vectorizada.
+
+
+class StaticKDTree:
+    """
+    KD-Tree de solo lectura para muchos puntos: sin un objeto Python por punto ni
+    por nodo. Se construye una vez en O(n log n) partiendo cada rango por la mediana
+    con `argpartition` (eje de mayor extensión) hasta dejar hojas de <= leaf_size
+    puntos.
+    """
+
+    def __init__(self, points, leaf_size=16):
+        points = np.asarray(points, dtype=np.float64)
+        if points.ndim != 2:
+            points = points.reshape(len(points), -1)
+        if leaf_size < 1:
+            raise ValueError("leaf_size debe ser >= 1")
+        self.leaf_size = leaf_size
+        self.ids = np.arange(len(points))
+        self.points = points.copy()
+        self._build()
+
+    def __len__(self):
+        return len(self.points)
+
+    # --- construcción ---
+    def _build(self):
+        n, dim = self.points.shape
+        max_nodes = max(1, 4 * -(-n // self.leaf_size))
+        self.axis = np.zeros(max_nodes, dtype=np.int8)
+        self.split = np.zeros(max_nodes, dtype=np.float64)
+        self.left = np.full(max_nodes, -1, dtype=np.int32)
+        self.right = np.full(max_nodes, -1, dtype=np.int32)
+        self.start = np.zeros(max_nodes, dtype=np.int64)
+        self.end = np.zeros(max_nodes, dtype=np.int64)
+        self.lo = np.zeros((max_nodes, dim), dtype=np.float64)
+        self.hi = np.zeros((max_nodes, dim), dtype=np.float64)
+
+        pts, ids = self.points, self.ids
+        count = 1
+        self.end[0] = n
+        stack = [0] if n > 0 else []
+        while stack:
+            k = stack.pop()
+            s, e = self.start[k], self.end[k]
+            if e - s <= self.leaf_size:
+                continue
+            block = pts[s:e]
+            self.lo[k] = block.min(axis=0)
+            self.hi[k] = block.max(axis=0)
+
+            # mediana del eje más extendido; argpartition deja el rango reordenado en O(m)
+            ax = int(np.argmax(self.hi[k] - self.lo[k]))
+            mid = (e - s) // 2
+            order = np.argpartition(block[:, ax], mid)
+            pts[s:e] = block[order]
+            ids[s:e] = ids[s:e][order]
+
+            self.axis[k] = ax
+            self.split[k] = pts[s + mid, ax]
+            left, right = count, count + 1
+            count += 2
+            self.left[k], self.right[k] = left, right
+            self.start[left], self.end[left] = s, s + mid
+            self.start[right], self.end[right] = s + mid, e
+            stack.extend((right, left))
+
+        for name in ('axis', 'split', 'left', 'right', 'start', 'end', 'lo', 'hi'):
+            setattr(self, name, getattr(self, name)[:count].copy())
+
+        # cajas de las hojas en bloque: sus rangos son disjuntos y cubren `points`
+        leaves = np.flatnonzero(self.left < 0)
+        leaves = leaves[self.end[leaves] > self.start[leaves]]
+        if len(leaves):
+            leaves = leaves[np.argsort(self.start[leaves])]
+            self.lo[leaves] = np.minimum.reduceat(pts, self.start[leaves], axis=0)
+            self.hi[leaves] = np.maximum.reduceat(pts, self.start[leaves], axis=0)
+
+    @property
+    def num_nodes(self):
+        return len(self.left)
+
+    # --- consultas ---
+    def nearest(self, point, k=1):
+        """Los k puntos más cercanos: arreglos (ids, dists) ordenados por distancia
+        (ids = posiciones en los puntos originales).
+
+        Recorrido en profundidad que baja primero por el hijo del lado de la
+        consulta; el otro hijo se descarta si el plano de corte queda más lejos que
+        el k-ésimo mejor punto. Las hojas se revisan vectorizadas.
+        """
+        q = np.asarray(point, dtype=np.float64)
+        k = min(k, len(self.points))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        qs = q.tolist()
+        axis, split, left, right = self.axis, self.split, self.left, self.right
+        best_d = np.empty(0)
+        best_i = np.empty(0, dtype=np.int64)
+        kth = np.inf
+        # (nodo, cota inferior de la distancia a sus puntos)
+        stack = [(0, 0.0)]
+        while stack:
+            node, bound = stack.pop()
+            if bound > kth:
+                continue
+            if left[node] < 0:
+                s, e = self.start[node], self.end[node]
+                diff = self.points[s:e] - q
+                best_d = np.concatenate((best_d, np.sqrt(np.einsum('ij,ij->i', diff, diff))))
+                best_i = np.concatenate((best_i, np.arange(s, e)))
+                if len(best_d) > k:
+                    keep = np.argpartition(best_d, k - 1)[:k]
+                    best_d, best_i = best_d[keep], best_i[keep]
+                if len(best_d) == k:
+                    kth = best_d.max()
+                continue
+            gap = qs[axis[node]] - split[node]
+            near, far = (left[node], right[node]) if gap < 0 else (right[node], left[node])
+            stack.append((far, max(bound, abs(gap))))
+            stack.append((near, bound))
+
+        order = np.argsort(best_d, kind='stable')
+        return self.ids[best_i[order]], best_d[order]
+
+    def query_radius(self, point, r):
+        """ids (originales) de los puntos a distancia <= r de point."""
+        q = np.asarray(point, dtype=np.float64)
+        qs = q.tolist()
+        found = []
+        stack = [0] if len(self.points) else []
+        while stack:
+            node = stack.pop()
+            if self.left[node] < 0:
+                s, e = self.start[node], self.end[node]
+                diff = self.points[s:e] - q
+                found.append(self.ids[s:e][np.einsum('ij,ij->i', diff, diff) <= r * r])
+                continue
+            # solo los hijos que el círculo alcanza a tocar respecto del plano de corte
+            gap = qs[self.axis[node]] - self.split[node]
+            if gap <= r:
+                stack.append(self.left[node])
+            if gap >= -r:
+                stack.append(self.right[node])
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+    # --- consultas en lote ---
+    def _leaf_blocks(self):
+        """Hojas como bloques rellenos (num_hojas x leaf_size): coordenadas (inf en el
+        relleno) y posición en `points` (-1). Se arma una vez, en la primera consulta en lote."""
+        if getattr(self, '_blocks', None) is None:
+            leaves = np.flatnonzero(self.left < 0)
+            slot = np.full(self.num_nodes, -1, dtype=np.int64)
+            slot[leaves] = np.arange(len(leaves))
+            sizes = (self.end - self.start)[leaves]
+            width = max(1, int(sizes.max()) if len(leaves) else 1)
+            pos = np.full((len(leaves), width), -1, dtype=np.int64)
+            cols = np.arange(width)
+            valid = cols < sizes[:, None]
+            pos[valid] = (self.start[leaves][:, None] + cols)[valid]
+            coords = np.full(pos.shape + (self.points.shape[1],), np.inf)
+            coords[valid] = self.points[pos[valid]]
+            self._blocks = (slot, coords, pos)
+        return self._blocks
+
+    def _descend(self, qs):
+        """Hoja de cada consulta, bajando todas a la vez nivel por nivel."""
+        node = np.zeros(len(qs), dtype=np.int64)
+        inner = np.flatnonzero(self.left[node] >= 0)
+        while len(inner):
+            nd = node[inner]
+            go_left = qs[inner, self.axis[nd]] < self.split[nd]
+            node[inner] = np.where(go_left, self.left[nd], self.right[nd])
+            inner = inner[self.left[node[inner]] >= 0]
+        return node
+
+    def _leaf_pairs(self, qs, q, nodes):
+        """Distancias de cada par (consulta, hoja) a todos los puntos de la hoja:
+        (consulta repetida, distancia, posición), aplanados y sin el relleno."""
+        slot, coords, pos = self._leaf_blocks()
+        block = coords[slot[nodes]]
+        diff = block - qs[q][:, None, :]
+        d = np.sqrt(np.einsum('ijk,ijk->ij', diff, diff))
+        p = pos[slot[nodes]]
+        valid = p >= 0
+        return np.broadcast_to(q[:, None], p.shape)[valid], d[valid], p[valid]
+
+    def _box_dist(self, qs, q, nodes):
+        delta = np.maximum(np.maximum(self.lo[nodes] - qs[q], 0.0), qs[q] - self.hi[nodes])
+        return np.sqrt(np.einsum('ij,ij->i', delta, delta))
+
+    def batch_query(self, points, k=1):
+        """kNN para m consultas a la vez: arreglos (ids, dists) de forma (m, k), cada fila
+        ordenada por distancia (k se limita a len(self); sin puntos, (m, 0)).
+
+        Todo se hace sobre pares (consulta, nodo) con operaciones vectorizadas, una
+        ronda por nivel del árbol: primero cada consulta baja a su hoja para tener
+        una cota inicial; luego se expande desde la raíz descartando los nodos cuya
+        caja está más lejos que el k-ésimo vecino actual de esa consulta. El costo
+        Python depende de la altura, no de m.
+        """
+        qs = np.asarray(points, dtype=np.float64).reshape(-1, self.points.shape[1])
+        m = len(qs)
+        k = min(k, len(self.points))
+        best_d = np.full((m, k), np.inf)
+        best_p = np.zeros((m, k), dtype=np.int64)
+        if k <= 0 or m == 0:
+            return best_p, best_d
+
+        def merge(q, d, p):
+            nonlocal best_d, best_p
+            q = np.concatenate((np.repeat(np.arange(m), k), q))
+            d = np.concatenate((best_d.ravel(), d))
+            p = np.concatenate((best_p.ravel(), p))
+            order = np.lexsort((d, q))
+            q, d, p = q[order], d[order], p[order]
+            # rango de cada candidato dentro de su consulta; se quedan los k primeros
+            rank = np.arange(len(q)) - np.searchsorted(q, q)
+            keep = rank < k
+            best_d = d[keep].reshape(m, k)
+            best_p = p[keep].reshape(m, k)
+
+        all_q = np.arange(m)
+        home = self._descend(qs)
+        merge(*self._leaf_pairs(qs, all_q, home))
+
+        q, nodes = all_q, np.zeros(m, dtype=np.int64)
+        while len(q):
+            near = self._box_dist(qs, q, nodes) < best_d[q, k - 1]
+            q, nodes = q[near], nodes[near]
+            leaf = self.left[nodes] < 0
+            fresh = leaf & (nodes != home[q])
+            if fresh.any():
+                merge(*self._leaf_pairs(qs, q[fresh], nodes[fresh]))
+            q, nodes = q[~leaf], nodes[~leaf]
+            q = np.concatenate((q, q))
+            nodes = np.concatenate((self.left[nodes], self.right[nodes])).astype(np.int64)
+        return self.ids[best_p], best_d
+
+    def batch_query_radius(self, points, r):
+        """Vecinos a distancia <= r de cada una de m consultas: listas (ids, dists) con un
+        arreglo por consulta, ordenado por distancia. Mismo recorrido por pares
+        (consulta, nodo) que batch_query, con la cota fija r."""
+        qs = np.asarray(points, dtype=np.float64).reshape(-1, self.points.shape[1])
+        m = len(qs)
+        hits_q, hits_d, hits_p = [], [], []
+        q = np.arange(m) if len(self.points) else np.empty(0, dtype=np.int64)
+        nodes = np.zeros(len(q), dtype=np.int64)
+        while len(q):
+            near = self._box_dist(qs, q, nodes) <= r
+            q, nodes = q[near], nodes[near]
+            leaf = self.left[nodes] < 0
+            if leaf.any():
+                hq, hd, hp = self._leaf_pairs(qs, q[leaf], nodes[leaf])
+                inside = hd <= r
+                hits_q.append(hq[inside])
+                hits_d.append(hd[inside])
+                hits_p.append(hp[inside])
+            q, nodes = q[~leaf], nodes[~leaf]
+            q = np.concatenate((q, q))
+            nodes = np.concatenate((self.left[nodes], self.right[nodes])).astype(np.int64)
+
+        if not hits_q:
+            return [np.empty(0, dtype=np.int64) for _ in range(m)], [np.empty(0) for _ in range(m)]
+        q_all, d_all, p_all = np.concatenate(hits_q), np.concatenate(hits_d), np.concatenate(hits_p)
+        order = np.lexsort((d_all, q_all))
+        bounds = np.searchsorted(q_all[order], np.arange(1, m))
+        return np.split(self.ids[p_all[order]], bounds), np.split(d_all[order], bounds)
+
+    def query_range(self, lo, hi):
+        """ids (originales) de los puntos dentro de la caja [lo, hi] (inclusive).
+        Los subárboles cuya caja queda dentro de la consulta se reportan enteros."""
+        lo = np.asarray(lo, dtype=np.float64)
+        hi = np.asarray(hi, dtype=np.float64)
+        found = []
+        stack = [0] if len(self.points) else []
+        while stack:
+            node = stack.pop()
+            if (self.hi[node] < lo).any() or (self.lo[node] > hi).any():
+                continue
+            s, e = self.start[node], self.end[node]
+            if (self.lo[node] >= lo).all() and (self.hi[node] <= hi).all():
+                found.append(self.ids[s:e])
+            elif self.left[node] < 0:
+                block = self.points[s:e]
+                found.append(self.ids[s:e][((block >= lo) & (block <= hi)).all(axis=1)])
+            else:
+                stack.extend((self.right[node], self.left[node]))
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
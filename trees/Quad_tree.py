@@ -1,3 +1,7 @@
+import heapq
+import itertools
+import math
+
 from Nodes.Rectangle_Q import Rectangle_Q
 from Nodes.R_tree.Point import Point
 
@@ -31,6 +35,16 @@ class QuadTree:
         self.divided = True
 
     def insert(self, point):
+        """Inserta el punto. Si cae fuera de la boundary, la raíz crece hacia él
+        (grow) hasta contenerlo; solo falla con coordenadas no finitas."""
+        if not (math.isfinite(point.x) and math.isfinite(point.y)):
+            return False
+        while not self.boundary.contains(point):
+            if not self.grow(point.x, point.y):
+                return False
+        return self._insert(point)
+
+    def _insert(self, point):
         if not self.boundary.contains(point):
             return False
 
@@ -41,13 +55,48 @@ class QuadTree:
             if not self.divided:
                 self.subdivide()
 
-            if self.northeast.insert(point): return True
-            if self.northwest.insert(point): return True
-            if self.southeast.insert(point): return True
-            if self.southwest.insert(point): return True
+            if self.northeast._insert(point): return True
+            if self.northwest._insert(point): return True
+            if self.southeast._insert(point): return True
+            if self.southwest._insert(point): return True
 
         return False
 
+    def grow(self, x, y):
+        """Duplica la extensión de la raíz hacia (x, y).
+
+        El contenido actual (puntos e hijos) pasa a un nodo nuevo que queda como
+        uno de los cuatro cuadrantes de la raíz agrandada, así que no se reinserta
+        nada; este objeto sigue siendo la raíz. Retorna False si la boundary es
+        degenerada y no puede crecer."""
+        b = self.boundary
+        if b.w <= 0 or b.h <= 0:
+            return False
+
+        old = QuadTree(b, self.capacity)
+        old.points = self.points
+        old.divided = self.divided
+        old.northeast, old.northwest = self.northeast, self.northwest
+        old.southeast, old.southwest = self.southeast, self.southwest
+
+        # el centro nuevo es la esquina de la boundary actual más cercana a (x, y)
+        cx = b.x - b.w if x < b.x else b.x + b.w
+        cy = b.y - b.h if y < b.y else b.y + b.h
+        self.boundary = Rectangle_Q(cx, cy, 2 * b.w, 2 * b.h)
+        self.points = []
+        self.subdivide()
+
+        # misma convención que subdivide: "norte" es y menor
+        east = b.x > cx
+        south = b.y > cy
+        if south:
+            if east: self.southeast = old
+            else:    self.southwest = old
+        else:
+            if east: self.northeast = old
+            else:    self.northwest = old
+        return True
+
     def query(self, range_rect, found=None):
         if found is None:
             found = []
@@ -66,3 +115,26 @@ class QuadTree:
             self.southeast.query(range_rect, found)
 
         return found
+
+    def nearest(self, x, y, k=1):
+        """Los k puntos más cercanos a (x, y) como lista de (point, dist).
+        Búsqueda best-first: cuadrantes y puntos en una cola ordenada por distancia."""
+        result = []
+        if k <= 0:
+            return result
+        tie = itertools.count()
+        # (distancia, desempate, cuadrante o None, punto o None)
+        heap = [(self.boundary.min_dist(x, y), next(tie), self, None)]
+        while heap:
+            dist, _, node, point = heapq.heappop(heap)
+            if point is not None:
+                result.append((point, dist))
+                if len(result) >= k:
+                    break
+                continue
+            for p in node.points:
+                heapq.heappush(heap, (((p.x - x) ** 2 + (p.y - y) ** 2) ** 0.5, next(tie), None, p))
+            if node.divided:
+                for child in (node.northwest, node.northeast, node.southwest, node.southeast):
+                    heapq.heappush(heap, (child.boundary.min_dist(x, y), next(tie), child, None))
+        return result
@@ -0,0 +1,172 @@
+import numpy as np
+
+from Nodes.Bucket import BucketArray
+from Nodes.Rectangle_Q import Rectangle_Q
+
+# Nodo k:  bounds[k]   (cx, cy, w, h): centro y mitades de ancho/alto, como Rectangle_Q
+#          child[k]    índice del primer hijo (los 4 son consecutivos), -1 en hojas
+#          bucket[k]   bucket de la hoja en `buckets`, -1 en nodos internos
+# El hijo q = (x >= cx) + 2 * (y >= cy) de un nodo está en child[k] + q.
+
+
+class FlatQuadTree:
+    """
+    PR-quadtree con nodos en arreglos planos y puntos en buckets (BucketArray).
+
+    Solo las hojas guardan puntos; al llenarse una hoja se divide en 4 y sus puntos
+    se reparten. A profundidad max_depth las hojas no se dividen más y lo que no
+    cabe va al desborde del bucket, así que muchos puntos idénticos (POIs del mismo
+    edificio) no generan árboles degenerados. Cada punto es (x, y, id de fila).
+    """
+
+    def __init__(self, boundary, capacity=4, max_depth=16, initial=16):
+        self.capacity = capacity
+        self.max_depth = max_depth
+        self.buckets = BucketArray(capacity)
+        self.bounds = np.empty((initial, 4), dtype=np.float64)
+        self.child = np.empty(initial, dtype=np.int32)
+        self.bucket = np.empty(initial, dtype=np.int32)
+        self._n = 0
+        self.size = 0
+        self._new_node(boundary.x, boundary.y, boundary.w, boundary.h)
+
+    def __len__(self):
+        return self.size
+
+    def _new_node(self, cx, cy, w, h, bucket=None):
+        """Crea una hoja con el bucket dado (o uno nuevo) y devuelve su índice."""
+        if self._n == len(self.child):
+            rows = 2 * len(self.child)
+            for name in ('bounds', 'child', 'bucket'):
+                old = getattr(self, name)
+                grown = np.empty((rows,) + old.shape[1:], dtype=old.dtype)
+                grown[:self._n] = old[:self._n]
+                setattr(self, name, grown)
+        k = self._n
+        self.bounds[k] = (cx, cy, w, h)
+        self.child[k] = -1
+        self.bucket[k] = self.buckets.new() if bucket is None else bucket
+        self._n += 1
+        return k
+
+    def _descend(self, x, y):
+        """Hoja que contiene (x, y) y su profundidad."""
+        # .item() devuelve escalares de Python: comparar escalares NumPy domina el costo
+        bounds, child = self.bounds, self.child
+        node, depth = 0, 0
+        first = child.item(0)
+        while first >= 0:
+            node = first + (x >= bounds.item(node, 0)) + 2 * (y >= bounds.item(node, 1))
+            first = child.item(node)
+            depth += 1
+        return node, depth
+
+    def insert(self, x, y, row_id=None):
+        """Inserta (x, y); False si está fuera de la boundary."""
+        x, y = float(x), float(y)
+        cx, cy, w, h = self.bounds[0].tolist()
+        if not (cx - w <= x <= cx + w and cy - h <= y <= cy + h):
+            return False
+        if row_id is None:
+            row_id = self.size
+
+        node, depth = self._descend(x, y)
+        while not self.buckets.add(int(self.bucket[node]), x, y, row_id):
+            if depth >= self.max_depth:
+                self.buckets.force(int(self.bucket[node]), x, y, row_id)
+                break
+            self._split(node)
+            node = self.child.item(node) + (x >= self.bounds.item(node, 0)) + 2 * (y >= self.bounds.item(node, 1))
+            depth += 1
+        self.size += 1
+        return True
+
+    def _split(self, node):
+        """Divide una hoja llena en 4 hijos y reparte sus puntos."""
+        b = int(self.bucket[node])
+        xs, ys, ids = self.buckets.entries(b)
+        xs, ys, ids = xs.copy(), ys.copy(), ids.copy()
+        cx, cy, w, h = self.bounds[node].tolist()
+        w, h = w / 2, h / 2
+        # orden de los hijos según q = (x >= cx) + 2 * (y >= cy); el primero
+        # hereda el bucket de la hoja, así los nodos internos no ocupan filas
+        first = self._new_node(cx - w, cy - h, w, h, bucket=b)
+        for dx, dy in ((w, -h), (-w, h), (w, h)):
+            self._new_node(cx + dx, cy + dy, w, h)
+        quadrant = (xs >= cx) + 2 * (ys >= cy)
+        for q in range(4):
+            mask = quadrant == q
+            self.buckets.fill(int(self.bucket[first + q]), xs[mask], ys[mask], ids[mask])
+        self.child[node] = first
+        self.bucket[node] = -1
+
+    def iter_query(self, range_rect):
+        """Genera (x, y, id) de los puntos dentro de range_rect (Rectangle_Q).
+        Recorre con pila explícita y produce los puntos de cada hoja a medida que
+        la visita; las hojas por completo dentro del rectángulo se emiten sin test."""
+        xmin, xmax = range_rect.x - range_rect.w, range_rect.x + range_rect.w
+        ymin, ymax = range_rect.y - range_rect.h, range_rect.y + range_rect.h
+        bounds, child, bucket = self.bounds, self.child, self.bucket
+        store = self.buckets
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            cx, cy = bounds.item(node, 0), bounds.item(node, 1)
+            w, h = bounds.item(node, 2), bounds.item(node, 3)
+            if cx - w > xmax or cx + w < xmin or cy - h > ymax or cy + h < ymin:
+                continue
+            first = child.item(node)
+            if first >= 0:
+                stack.extend(range(first, first + 4))
+                continue
+
+            b = bucket.item(node)
+            c = store.counts.item(b)
+            rows = zip(store.xs[b, :c].tolist(), store.ys[b, :c].tolist(), store.ids[b, :c].tolist())
+            extra = store.overflow.get(b, ())
+            if xmin <= cx - w and cx + w <= xmax and ymin <= cy - h and cy + h <= ymax:
+                yield from rows
+                yield from extra
+                continue
+            for row in rows:
+                if xmin <= row[0] <= xmax and ymin <= row[1] <= ymax:
+                    yield row
+            for row in extra:
+                if xmin <= row[0] <= xmax and ymin <= row[1] <= ymax:
+                    yield row
+
+    def query(self, range_rect):
+        """Lista de (x, y, id) dentro de range_rect."""
+        return list(self.iter_query(range_rect))
+
+    def count(self, range_rect):
+        return sum(1 for _ in self.iter_query(range_rect))
+
+    def num_nodes(self):
+        return self._n
+
+    def height(self):
+        """Profundidad máxima de una hoja (0 si la raíz es hoja)."""
+        best = 0
+        stack = [(0, 0)]
+        while stack:
+            node, depth = stack.pop()
+            best = max(best, depth)
+            if self.child[node] >= 0:
+                first = int(self.child[node])
+                stack.extend((k, depth + 1) for k in range(first, first + 4))
+        return best
+
+    def nbytes(self):
+        """Bytes de los arreglos de nodos y buckets (sin el desborde)."""
+        n = self._n
+        return (self.bounds[:n].nbytes + self.child[:n].nbytes + self.bucket[:n].nbytes +
+                self.buckets.nbytes())
+
+    @property
+    def boundary(self):
+        cx, cy, w, h = self.bounds[0].tolist()
+        return Rectangle_Q(cx, cy, w, h)
+
+    def __repr__(self):
+        return f"FlatQuadTree(points={self.size}, nodes={self._n}, max_depth={self.max_depth})"
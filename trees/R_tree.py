@@ -1,70 +1,449 @@
+import heapq
+import itertools
+import math
+import threading
+from contextlib import contextmanager
+
 from Nodes.R_tree.Rectangle_R import Rectangle
 from Nodes.R_node import R_node
-from Nodes.R_tree.Geometry_Utils import polygon_mbr, rect_polygon_intersection
+from Nodes.R_array_node import R_array_node
+from Nodes.R_tree.Geometry_Utils import polygon_mbr, rect_bounds, prepare_polygon
+
+NODE_LAYOUTS = {'list': R_node, 'array': R_array_node}
+
 
 class RTree:
-    def __init__(self, max_entries=4):
-        self.root = R_node(max_entries=max_entries, leaf=True)
+    def __init__(self, max_entries=4, policy='linear', layout='list', concurrent=False):
+        # policy: 'linear', 'quadratic' o 'rstar' (ver Nodes.R_node.POLICIES)
+        # layout: 'list' (un Rectangle por hijo) o 'array' (MBRs en arreglo NumPy por nodo)
+        # concurrent: lecturas sobre una versión publicada mientras otro hilo escribe
+        if layout not in NODE_LAYOUTS:
+            raise ValueError(f"Layout desconocido: {layout!r} (usar uno de {tuple(NODE_LAYOUTS)})")
+        self.node_class = NODE_LAYOUTS[layout]
+        self.root = self.node_class(max_entries=max_entries, leaf=True, policy=policy)
+        self.policy = policy
+        self.layout = layout
+        self.height = 0     # altura de la raíz (0 = la raíz es hoja)
+
+        # Modo concurrente (copy-on-write por caminos):
+        # `root` es la versión de trabajo del escritor y `_published` la que ven las
+        # consultas. Cada operación de escritura tiene su propio `epoch`; un nodo con
+        # otro epoch puede estar publicado y se clona antes de modificarlo. Al terminar
+        # la operación la nueva raíz se publica con una sola asignación.
+        self.concurrent = concurrent
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._epoch = 0
+        self._published = self.root
+        self._published_height = 0
+
+    def _read_root(self):
+        return self._published if self.concurrent else self.root
+
+    @contextmanager
+    def _writing(self):
+        """Delimita una operación de escritura; en modo concurrente la serializa y
+        publica el resultado al salir (o lo descarta si hubo una excepción)."""
+        if not self.concurrent:
+            yield None
+            return
+        with self._lock:
+            outer = self._depth == 0
+            if outer:
+                self._epoch += 1
+                self._own_root()
+            self._depth += 1
+            try:
+                yield self._epoch
+            except BaseException:
+                if outer:
+                    self.root, self.height = self._published, self._published_height
+                raise
+            finally:
+                self._depth -= 1
+            if outer:
+                self._published_height = self.height
+                self._published = self.root
+
+    def _own_root(self):
+        if self.root.epoch != self._epoch:
+            self.root = self.root.clone()
+            self.root.epoch = self._epoch
 
     def insert(self, rect, data=None):
-        split = self.root.insert(rect, data)
+        with self._writing():
+            self._insert_entry(rect, data, 0)
+
+    def _insert_entry(self, rect, data, level):
+        # contexto de una inserción: niveles ya reinsertados y entradas pendientes (R*)
+        ctx = {'root': self.root, 'reinserted': set(), 'pending': [],
+               'epoch': self._epoch if self.concurrent else None}
+        self._insert_at(rect, data, level, ctx)
+        while ctx['pending']:
+            r, child, level = ctx['pending'].pop(0)
+            self._insert_at(r, child, level, ctx)
+
+    def _insert_at(self, rect, data, level, ctx):
+        if self.concurrent:
+            self._own_root()
+        ctx['root'] = self.root
+        split = self.root.insert(rect, data, self.height, level, ctx)
         if split:
-            new_root = R_node(max_entries=self.root.max_entries, leaf=False)
+            new_root = self.node_class(max_entries=self.root.max_entries, leaf=False, policy=self.policy)
+            new_root.epoch = self.root.epoch
             new_root.children = [self.root, split]
             new_root.rectangles = [self.root.compute_mbr(), split.compute_mbr()]
             self.root = new_root
+            self.height += 1
+
+    # -------------------------------------------
+    #     BORRADO Y ACTUALIZACIÓN
+    # -------------------------------------------
+    def delete(self, rect, data):
+        """Elimina la entrada (rect, data). Devuelve False si no existe.
+
+        Tras quitarla se condensa el árbol: los nodos del camino que quedan por debajo
+        del mínimo se eliminan y sus entradas se reinsertan en su mismo nivel; el resto
+        ajusta su MBR en el padre. Si la raíz queda con un único hijo, baja un nivel.
+        """
+        with self._writing() as epoch:
+            found = self._find_leaf(rect, data)
+            if found is None:
+                return False
+            leaf, i, path = found
+            if epoch is not None:
+                leaf, path = self._own_path(path, leaf, epoch)
+            leaf._remove_entry(i)
+            self._condense(leaf, path)
+            return True
+
+    def update(self, old_rect, new_rect, data):
+        """Cambia el rectángulo de una entrada existente (borrado + reinserción)."""
+        with self._writing():
+            if not self.delete(old_rect, data):
+                return False
+            # data no se modifica: lo comparten las versiones ya publicadas del árbol
+            self.insert(new_rect, data)
+            return True
+
+    def move(self, rect, data, dx, dy):
+        """Desplaza una entrada (dx, dy); útil para POIs en movimiento."""
+        new_rect = Rectangle(rect.xmin + dx, rect.ymin + dy, rect.xmax + dx, rect.ymax + dy)
+        return self.update(rect, new_rect, data)
+
+    def _own_path(self, path, leaf, epoch):
+        # clona (si hace falta) cada nodo del camino raíz -> hoja antes de modificarlo
+        if not path:
+            return self.root, []
+        owned = []
+        node = self.root
+        for _, i in path:
+            owned.append((node, i))
+            node = node._child_for_write(i, epoch)
+        return node, owned
+
+    def _find_leaf(self, rect, data):
+        # devuelve (hoja, índice, camino [(padre, índice del hijo)]) o None
+        stack = [(self.root, [])]
+        while stack:
+            node, path = stack.pop()
+            if node.leaf:
+                for i, child in enumerate(node.children):
+                    if (child is data or child == data) and _same_rect(node.rect_at(i), rect):
+                        return node, i, path
+            else:
+                for i in node.intersecting(rect):
+                    stack.append((node.children[i], path + [(node, i)]))
+        return None
+
+    def _condense(self, node, path):
+        orphans = []    # (rect, hijo, altura del nodo que lo contenía)
+        height = 0
+        for parent, i in reversed(path):
+            if len(node.children) < node.min_entries:
+                parent._remove_entry(i)
+                for j in range(len(node.children)):
+                    orphans.append((node.rect_at(j), node.children[j], height))
+            else:
+                parent._set_rect(i, node.compute_mbr())
+            node = parent
+            height += 1
+
+        # raíz con un solo hijo: el hijo pasa a ser la raíz
+        while not self.root.leaf and len(self.root.children) == 1:
+            self.root = self.root.children[0]
+            self.height -= 1
+        if not self.root.leaf and not self.root.children:
+            self.root = self.node_class(max_entries=self.root.max_entries, leaf=True, policy=self.policy)
+            self.height = 0
+
+        for rect, child, level in orphans:
+            if level <= self.height:
+                self._insert_entry(rect, child, level)
+            else:
+                # el árbol quedó más bajo que el subárbol huérfano: reinsertar sus hojas
+                for leaf_rect, leaf_data in _leaf_entries(child):
+                    self._insert_entry(leaf_rect, leaf_data, 0)
+
+    # -------------------------------------------
+    #     CARGA MASIVA (Sort-Tile-Recursive)
+    # -------------------------------------------
+    @classmethod
+    def bulk_load(cls, entries, max_entries=4, policy='linear', layout='list', concurrent=False):
+        """Construye el árbol en una sola pasada a partir de pares (Rectangle, data).
+
+        Usa empaquetado STR: ordena por centro en x, corta en franjas verticales,
+        ordena cada franja por centro en y y agrupa de a `max_entries`. Las hojas
+        quedan llenas (salvo la última de cada franja) y no se hace ningún split.
+        """
+        tree = cls(max_entries=max_entries, policy=policy, layout=layout, concurrent=concurrent)
+        level = [(rect, data) for rect, data in entries]
+        if not level:
+            return tree
+
+        leaf = True
+        while True:
+            nodes = _str_pack(level, max_entries, leaf, policy, tree.node_class)
+            if len(nodes) == 1:
+                tree.root = nodes[0]
+                tree._published, tree._published_height = tree.root, tree.height
+                return tree
+            level = [(node.compute_mbr(), node) for node in nodes]
+            leaf = False
+            tree.height += 1
+
+    def items(self):
+        """Devuelve todas las entradas de hoja como lista de (rect, data)."""
+        result = []
+        stack = [self._read_root()]
+        while stack:
+            node = stack.pop()
+            if node.leaf:
+                result.extend(zip(node.rectangles, node.children))
+            else:
+                stack.extend(node.children)
+        return result
 
     def search(self, query_rect):
         # devuelve lista de tuplas (data, rect) para las hojas
-        return self._search_node(self.root, query_rect)
+        return list(self.iter_search(query_rect))
+
+    def iter_search(self, query_rect, limit=None):
+        """Genera (data, rect) de las hojas que intersectan query_rect, de forma perezosa.
+
+        Recorre el árbol con una pila explícita (sin recursión ni listas intermedias)
+        y se detiene tras `limit` resultados si se indica.
+        """
+        if limit is not None and limit <= 0:
+            return
+        emitted = 0
+        stack = [self._read_root()]
+        while stack:
+            node = stack.pop()
+            hits = node.intersecting(query_rect)
+            if node.leaf:
+                for i in hits:
+                    # devolver tanto el dato como su rectángulo asociado
+                    yield node.children[i], node.rect_at(i)
+                    emitted += 1
+                    if limit is not None and emitted >= limit:
+                        return
+            else:
+                # apilar en orden inverso para visitar los hijos de izquierda a derecha
+                stack.extend(node.children[i] for i in reversed(hits))
+
+    def count(self, query_rect, limit=None):
+        """Número de entradas que intersectan query_rect (sin construir resultados).
+        Con `limit` deja de contar al alcanzarlo."""
+        total = 0
+        stack = [self._read_root()]
+        while stack:
+            node = stack.pop()
+            hits = node.intersecting(query_rect)
+            if node.leaf:
+                total += len(hits)
+                if limit is not None and total >= limit:
+                    return limit
+            else:
+                stack.extend(node.children[i] for i in hits)
+        return total
+
+    def exists(self, query_rect):
+        """True si al menos una entrada intersecta query_rect; corta en la primera."""
+        return self.count(query_rect, limit=1) > 0
+    
+    # -------------------------------------------
+    #     CONSULTAS POR PROXIMIDAD
+    # -------------------------------------------
+    def nearest(self, x, y, k=1):
+        """Los k elementos más cercanos a (x, y) como lista de (data, rect, dist).
 
-    def _search_node(self, node, query_rect):
+        Búsqueda best-first: una cola de prioridad ordenada por MINDIST mezcla nodos
+        y entradas de hoja; la primera entrada que sale de la cola es la más cercana,
+        así que basta con detenerse tras extraer k entradas.
+        """
         result = []
-        for child, rect in zip(node.children, node.rectangles):
-            if rect.intersects(query_rect):
+        if k <= 0:
+            return result
+        tie = itertools.count()
+        # (distancia, desempate, nodo, índice de entrada en hoja o -1 si es el nodo)
+        heap = [(0.0, next(tie), self._read_root(), -1)]
+        while heap:
+            dist, _, node, i = heapq.heappop(heap)
+            if i >= 0:
+                result.append((node.children[i], node.rect_at(i), dist))
+                if len(result) >= k:
+                    break
+                continue
+            for j, d in enumerate(node.min_dists(x, y)):
                 if node.leaf:
-                    # devolver tanto el dato como su rectángulo asociado
-                    result.append((child, rect))
+                    heapq.heappush(heap, (d, next(tie), node, j))
                 else:
-                    result.extend(self._search_node(child, query_rect))
+                    heapq.heappush(heap, (d, next(tie), node.children[j], -1))
         return result
-    
+
+    def within_distance(self, x, y, r):
+        """Elementos cuyo MBR está a distancia <= r de (x, y), ordenados por distancia."""
+        result = []
+        stack = [self._read_root()]
+        while stack:
+            node = stack.pop()
+            for j, d in enumerate(node.min_dists(x, y)):
+                if d > r:
+                    continue
+                if node.leaf:
+                    result.append((node.children[j], node.rect_at(j), d))
+                else:
+                    stack.append(node.children[j])
+        result.sort(key=lambda item: item[2])
+        return result
+
     # -------------------------------------------
     #     CONSULTA POR INTERSECCIÓN DE POLÍGONO
     # -------------------------------------------
     def intersect_polygon(self, polygon):
-        # 1. MBR del polígono
-        mbr_vals = polygon_mbr(polygon)
-        # polygon_mbr puede devolver una tupla (xmin, ymin, xmax, ymax) o un objeto con .bounds
-        if isinstance(mbr_vals, tuple) and len(mbr_vals) == 4:
-            xmin, ymin, xmax, ymax = mbr_vals
-            mbr = Rectangle(xmin, ymin, xmax, ymax)
-        else:
-            # si viene algo con .bounds
-            try:
-                xmin, ymin, xmax, ymax = mbr_vals
-                mbr = Rectangle(xmin, ymin, xmax, ymax)
-            except Exception:
-                raise TypeError('polygon_mbr debe devolver (xmin,ymin,xmax,ymax)')
+        # 1. MBR del polígono (y coordenadas/aristas precalculadas para el refinamiento)
+        prepared = prepare_polygon(polygon)
+        mbr = _polygon_rect(prepared)
 
         # 2. Búsqueda rápida con el R-Tree
-        candidatos = self.search(mbr)
+        candidatos = self.iter_search(mbr)
 
-        # 3. Filtrado exacto: candidatos es lista de (data, rect)
-        resultados = []
-        for data_obj, rect in candidatos:
-            # compatibilidad: si el dato almacenado incluye su propia MBR bajo 'mbr', úsala
-            try:
-                candidate_rect = None
-                if isinstance(data_obj, dict) and 'mbr' in data_obj:
-                    candidate_rect = data_obj['mbr']
-                else:
-                    candidate_rect = rect
-                if rect_polygon_intersection(candidate_rect, polygon):
-                    # devolver tanto el dato como la MBR utilizada para facilitar la presentación
-                    resultados.append({'data': data_obj, 'rect': candidate_rect})
-            except Exception:
-                # en caso de error con el objeto, omitirlo
-                continue
+        # 3. Filtrado exacto vectorizado sobre todos los candidatos (data, rect)
+        return _refine(candidatos, prepared)
+
+    def intersect_polygons(self, polygons):
+        """Consulta por lotes: un único recorrido del árbol para varios polígonos.
+
+        Cada nodo se visita una sola vez con el subconjunto de polígonos cuyo MBR
+        todavía puede tocarlo. Devuelve una lista alineada con `polygons`: en la
+        posición i, la lista de {'data', 'rect'} que daría intersect_polygon(polygons[i])
+        (polígonos repetidos o no hashables se tratan por posición).
+        """
+        polygons = list(polygons)
+        if not polygons:
+            return []
+        prepared = [prepare_polygon(polygon) for polygon in polygons]
+        mbrs = [_polygon_rect(polygon) for polygon in prepared]
+        candidatos = [[] for _ in polygons]
+
+        # pila de (nodo, índices de polígonos activos en ese nodo)
+        stack = [(self._read_root(), list(range(len(polygons))))]
+        while stack:
+            node, active = stack.pop()
+            per_entry = {}
+            for p in active:
+                for i in node.intersecting(mbrs[p]):
+                    per_entry.setdefault(i, []).append(p)
+
+            for i, active_i in per_entry.items():
+                if not node.leaf:
+                    stack.append((node.children[i], active_i))
+                    continue
+                entry = (node.children[i], node.rect_at(i))
+                for p in active_i:
+                    candidatos[p].append(entry)
+
+        return [_refine(cands, prep) for prep, cands in zip(prepared, candidatos)]
+
+
+def _same_rect(a, b):
+    return (a.xmin, a.ymin, a.xmax, a.ymax) == (b.xmin, b.ymin, b.xmax, b.ymax)
+
+
+def _leaf_entries(child):
+    """Entradas de hoja (rect, data) bajo un subárbol huérfano."""
+    result = []
+    stack = [child]
+    while stack:
+        node = stack.pop()
+        if node.leaf:
+            result.extend((node.rect_at(i), node.children[i]) for i in range(len(node.children)))
+        else:
+            stack.extend(node.children)
+    return result
+
+
+def _polygon_rect(polygon):
+    """MBR de un polígono como Rectangle."""
+    mbr_vals = polygon_mbr(polygon)
+    # polygon_mbr puede devolver una tupla (xmin, ymin, xmax, ymax) o un objeto con .bounds
+    try:
+        xmin, ymin, xmax, ymax = mbr_vals
+    except Exception:
+        raise TypeError('polygon_mbr debe devolver (xmin,ymin,xmax,ymax)')
+    return Rectangle(xmin, ymin, xmax, ymax)
+
+
+def _refine(candidatos, prepared):
+    """Filtro exacto de pares (data, rect) contra un PreparedPolygon en una sola pasada.
+    Devuelve lista de {'data', 'rect'}.
+
+    Se usa el rectángulo guardado en la hoja, no data['mbr']: la hoja pertenece a la
+    versión del árbol que se está leyendo, mientras que data puede compartirse entre
+    versiones."""
+    kept = []
+    boxes = []
+    for data_obj, candidate_rect in candidatos:
+        try:
+            boxes.append(rect_bounds(candidate_rect))
+        except Exception:
+            # en caso de error con el objeto, omitirlo
+            continue
+        kept.append((data_obj, candidate_rect))
+
+    if not kept:
+        return []
+    mask = prepared.intersects_rects(boxes)
+    # devolver tanto el dato como la MBR utilizada para facilitar la presentación
+    return [{'data': data_obj, 'rect': candidate_rect}
+            for (data_obj, candidate_rect), hit in zip(kept, mask) if hit]
+
+
+def _center_x(entry):
+    rect = entry[0]
+    return (rect.xmin + rect.xmax) / 2.0
+
+
+def _center_y(entry):
+    rect = entry[0]
+    return (rect.ymin + rect.ymax) / 2.0
+
+
+def _str_pack(entries, max_entries, leaf, policy='linear', node_class=R_node):
+    """Agrupa un nivel de entradas (rect, hijo) en nodos llenos usando STR."""
+    num_nodes = math.ceil(len(entries) / max_entries)
+    num_slices = math.ceil(math.sqrt(num_nodes))
+    slice_size = num_slices * max_entries
 
-        return resultados
\ No newline at end of file
+    entries = sorted(entries, key=_center_x)
+    nodes = []
+    for s in range(0, len(entries), slice_size):
+        vertical_slice = sorted(entries[s:s + slice_size], key=_center_y)
+        for k in range(0, len(vertical_slice), max_entries):
+            group = vertical_slice[k:k + max_entries]
+            node = node_class(max_entries, leaf=leaf, policy=policy)
+            node.rectangles = [rect for rect, _ in group]
+            node.children = [child for _, child in group]
+            nodes.append(node)
+    return nodes
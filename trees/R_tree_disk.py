@@ -0,0 +1,339 @@
+import heapq
+import itertools
+import mmap
+import struct
+
+import numpy as np
+
+from Nodes.R_node import POLICIES, R_node
+from Nodes.R_tree.Rectangle_R import Rectangle
+from .R_tree import RTree
+from .buffer_pool import BufferPool
+
+# ===========================================
+#   R-Tree en disco: páginas de tamaño fijo en un único archivo (mmap)
+# ===========================================
+#
+# Página 0 = cabecera:  magic, page_size, max_entries, root, height, num_pages, size,
+#                       policy (u8: 1 + índice en POLICIES)
+# Página de nodo:       [leaf u8][pad u8][count u16][pad 4 bytes]
+#                       [max_entries x (xmin, ymin, xmax, ymax) float64]
+#                       [max_entries x hijo int64]
+#
+# En las hojas el "hijo" es un id entero del dato (p. ej. la fila del POI en una
+# tabla externa); en los nodos internos es el número de página del hijo.
+
+MAGIC = b'RTREEPG1'
+HEADER = struct.Struct('<8sIIqqqqB7x')
+NODE_HEADER = struct.Struct('<BxH4x')
+ENTRY_BYTES = 4 * 8 + 8
+DEFAULT_PAGE_SIZE = 4096
+# política por defecto, y la de los archivos sin política guardada. 'linear' (la
+# de RTree) deja páginas casi vacías con capacidades chicas, y en disco cada
+# página de más es una lectura
+DEFAULT_POLICY = 'quadratic'
+
+
+class DiskNode:
+    """ Nodo decodificado de una página: MBRs (k x 4) e ids/páginas de los hijos """
+    __slots__ = ('leaf', 'mbrs', 'children')
+
+    def __init__(self, leaf, mbrs, children):
+        self.leaf = leaf
+        self.mbrs = mbrs
+        self.children = children
+
+    def compute_mbr(self):
+        m = self.mbrs
+        return Rectangle(float(m[:, 0].min()), float(m[:, 1].min()),
+                         float(m[:, 2].max()), float(m[:, 3].max()))
+
+    def intersecting(self, query_rect):
+        m = self.mbrs
+        mask = ((m[:, :2] <= (query_rect.xmax, query_rect.ymax)) &
+                (m[:, 2:] >= (query_rect.xmin, query_rect.ymin))).all(axis=1)
+        return np.flatnonzero(mask)
+
+    def min_dists(self, x, y):
+        m = self.mbrs
+        dx = np.maximum(np.maximum(m[:, 0] - x, 0.0), x - m[:, 2])
+        dy = np.maximum(np.maximum(m[:, 1] - y, 0.0), y - m[:, 3])
+        return np.hypot(dx, dy)
+
+
+class DiskRTree:
+    """
+    R-Tree persistente: cada nodo ocupa una página de `page_size` bytes en un archivo
+    accedido con mmap. Las páginas se leen a través de un BufferPool LRU de
+    `cache_pages` páginas (con contadores de aciertos/fallos), de modo que solo los
+    niveles más usados quedan residentes.
+
+    Las hojas guardan ids enteros; los datos asociados (tags, nombre...) se
+    mantienen fuera del índice.
+    """
+
+    def __init__(self, path, cache_pages=64, policy=None):
+        # policy: división de páginas llenas ('linear', 'quadratic' o 'rstar' sin reinserción).
+        # Se guarda en la cabecera; al abrir se usa la guardada y pasar otra es un error.
+        self.path = path
+        self._file = open(path, 'r+b')
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+        magic, page_size, max_entries, root, height, num_pages, size, code = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} no es un archivo de DiskRTree")
+        if not 1 <= code <= len(POLICIES):
+            raise ValueError(f"{path}: código de política desconocido {code}")
+        stored = POLICIES[code - 1]
+        if policy is not None:
+            _policy_code(policy)
+            if policy != stored:
+                raise ValueError(f"{path} usa la política {stored!r}, no {policy!r}")
+        self.page_size = page_size
+        self.max_entries = max_entries
+        self.root = root
+        self.height = height
+        self.num_pages = num_pages
+        self.size = size
+        self.policy = stored
+        self.pool = BufferPool(cache_pages, self._read_page)
+
+    # --- creación ---
+    @classmethod
+    def create(cls, path, page_size=DEFAULT_PAGE_SIZE, max_entries=None, cache_pages=64, policy=DEFAULT_POLICY):
+        """Crea un archivo nuevo con un árbol vacío (raíz hoja en la página 1)."""
+        max_entries = _check_capacity(page_size, max_entries)
+        code = _policy_code(policy)
+        with open(path, 'wb') as f:
+            f.truncate(2 * page_size)
+            f.write(HEADER.pack(MAGIC, page_size, max_entries, 1, 0, 2, 0, code))
+            f.seek(page_size)
+            f.write(NODE_HEADER.pack(1, 0))
+        return cls(path, cache_pages=cache_pages)
+
+    @classmethod
+    def bulk_create(cls, path, entries, page_size=DEFAULT_PAGE_SIZE, max_entries=None, cache_pages=64,
+                    policy=DEFAULT_POLICY):
+        """Crea el archivo empaquetando (Rectangle, id) con STR (ver RTree.bulk_load);
+        policy se usa en las inserciones posteriores."""
+        max_entries = _check_capacity(page_size, max_entries)
+        code = _policy_code(policy)
+        entries = [(rect, int(row_id)) for rect, row_id in entries]
+        if not entries:
+            return cls.create(path, page_size, max_entries, cache_pages, policy)
+        mem = RTree.bulk_load(entries, max_entries=max_entries, layout='array')
+
+        # numerar páginas en anchura: la raíz es la página 1
+        order = [mem.root]
+        page_of = {id(mem.root): 1}
+        for node in order:
+            if not node.leaf:
+                for child in node.children:
+                    page_of[id(child)] = len(order) + 1
+                    order.append(child)
+
+        num_pages = len(order) + 1
+        with open(path, 'wb') as f:
+            f.truncate(num_pages * page_size)
+            f.write(HEADER.pack(MAGIC, page_size, max_entries, 1, mem.height, num_pages, len(entries), code))
+            for node in order:
+                if node.leaf:
+                    children = np.asarray(node.children, dtype=np.int64)
+                else:
+                    children = np.asarray([page_of[id(c)] for c in node.children], dtype=np.int64)
+                f.seek(page_of[id(node)] * page_size)
+                f.write(_encode(DiskNode(node.leaf, node.mbrs, children), max_entries))
+        return cls(path, cache_pages=cache_pages)
+
+    # --- páginas ---
+    def _read_page(self, page_id):
+        off = page_id * self.page_size
+        leaf, count = NODE_HEADER.unpack_from(self._mm, off)
+        off += NODE_HEADER.size
+        mbrs = np.frombuffer(self._mm, dtype=np.float64, count=count * 4, offset=off).reshape(count, 4).copy()
+        off += self.max_entries * 4 * 8
+        children = np.frombuffer(self._mm, dtype=np.int64, count=count, offset=off).copy()
+        return DiskNode(bool(leaf), mbrs, children)
+
+    def _write_page(self, page_id, node):
+        off = page_id * self.page_size
+        self._mm[off:off + self.page_size] = _encode(node, self.max_entries).ljust(self.page_size, b'\0')
+        self.pool.put(page_id, node)
+
+    def _allocate_page(self):
+        page_id = self.num_pages
+        self.num_pages += 1
+        needed = self.num_pages * self.page_size
+        if needed > len(self._mm):
+            # crecer el archivo al doble y volver a mapearlo
+            new_size = max(needed, 2 * len(self._mm))
+            self._mm.close()
+            self._file.truncate(new_size)
+            self._mm = mmap.mmap(self._file.fileno(), 0)
+        return page_id
+
+    def _write_header(self):
+        HEADER.pack_into(self._mm, 0, MAGIC, self.page_size, self.max_entries, self.root,
+                         self.height, self.num_pages, self.size, _policy_code(self.policy))
+
+    def node(self, page_id):
+        return self.pool.get(page_id)
+
+    # --- inserción ---
+    def insert(self, rect, row_id):
+        split = self._insert(self.root, self.height, rect, int(row_id))
+        if split is not None:
+            old_root = self.node(self.root)
+            new_root = DiskNode(False,
+                                np.array([_rect_row(old_root.compute_mbr()), _rect_row(self.node(split).compute_mbr())]),
+                                np.array([self.root, split], dtype=np.int64))
+            page_id = self._allocate_page()
+            self._write_page(page_id, new_root)
+            self.root = page_id
+            self.height += 1
+        self.size += 1
+        self._write_header()
+
+    def _insert(self, page_id, height, rect, row_id):
+        node = self.node(page_id)
+        if height == 0:
+            mbrs = np.vstack((node.mbrs, _rect_row(rect)))
+            children = np.append(node.children, row_id)
+        else:
+            i = _least_enlargement(node.mbrs, rect)
+            child_page = int(node.children[i])
+            split = self._insert(child_page, height - 1, rect, row_id)
+            mbrs = node.mbrs.copy()
+            mbrs[i] = _rect_row(self.node(child_page).compute_mbr())
+            children = node.children
+            if split is not None:
+                mbrs = np.vstack((mbrs, _rect_row(self.node(split).compute_mbr())))
+                children = np.append(children, split)
+
+        if len(children) <= self.max_entries:
+            self._write_page(page_id, DiskNode(node.leaf, mbrs, children))
+            return None
+
+        # página llena: reutilizar las políticas de división de R_node
+        tmp = R_node(self.max_entries, leaf=node.leaf, policy=self.policy)
+        tmp.rectangles = [Rectangle(*row) for row in mbrs.tolist()]
+        tmp.children = list(range(len(children)))
+        idx1, idx2 = tmp.split_groups()
+        new_page = self._allocate_page()
+        self._write_page(page_id, DiskNode(node.leaf, mbrs[idx1], children[idx1]))
+        self._write_page(new_page, DiskNode(node.leaf, mbrs[idx2], children[idx2]))
+        return new_page
+
+    # --- consultas ---
+    def iter_search(self, query_rect, limit=None):
+        """Genera (id, rect) de las entradas que intersectan query_rect."""
+        if limit is not None and limit <= 0:
+            return
+        emitted = 0
+        stack = [self.root]
+        while stack:
+            node = self.node(stack.pop())
+            hits = node.intersecting(query_rect)
+            if node.leaf:
+                for i in hits:
+                    yield int(node.children[i]), Rectangle(*node.mbrs[i].tolist())
+                    emitted += 1
+                    if limit is not None and emitted >= limit:
+                        return
+            else:
+                stack.extend(node.children[hits[::-1]].tolist())
+
+    def search(self, query_rect):
+        return list(self.iter_search(query_rect))
+
+    def count(self, query_rect):
+        total = 0
+        stack = [self.root]
+        while stack:
+            node = self.node(stack.pop())
+            hits = node.intersecting(query_rect)
+            if node.leaf:
+                total += len(hits)
+            else:
+                stack.extend(node.children[hits].tolist())
+        return total
+
+    def nearest(self, x, y, k=1):
+        """k entradas más cercanas a (x, y) como lista de (id, rect, dist)."""
+        result = []
+        if k <= 0 or self.size == 0:
+            return result
+        tie = itertools.count()
+        heap = [(0.0, next(tie), self.root, -1)]
+        while heap:
+            dist, _, page_id, i = heapq.heappop(heap)
+            node = self.node(page_id)
+            if i >= 0:
+                result.append((int(node.children[i]), Rectangle(*node.mbrs[i].tolist()), dist))
+                if len(result) >= k:
+                    break
+                continue
+            for j, d in enumerate(node.min_dists(x, y).tolist()):
+                if node.leaf:
+                    heapq.heappush(heap, (d, next(tie), page_id, j))
+                else:
+                    heapq.heappush(heap, (d, next(tie), int(node.children[j]), -1))
+        return result
+
+    # --- ciclo de vida ---
+    def stats(self):
+        info = self.pool.stats()
+        info.update({'pages': self.num_pages, 'page_size': self.page_size,
+                     'height': self.height, 'size': self.size})
+        return info
+
+    def flush(self):
+        self._write_header()
+        self._mm.flush()
+
+    def close(self):
+        if not self._mm.closed:
+            self.flush()
+            self.pool.clear()
+            self._mm.close()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _policy_code(policy):
+    if policy not in POLICIES:
+        raise ValueError(f"Política desconocida: {policy!r} (usar una de {POLICIES})")
+    return POLICIES.index(policy) + 1
+
+
+def _check_capacity(page_size, max_entries):
+    fit = (page_size - NODE_HEADER.size) // ENTRY_BYTES
+    if max_entries is None:
+        max_entries = fit
+    if max_entries < 2 or max_entries > fit:
+        raise ValueError(f"max_entries debe estar entre 2 y {fit} para page_size={page_size}")
+    return max_entries
+
+
+def _encode(node, max_entries):
+    count = len(node.children)
+    mbrs = np.zeros((max_entries, 4), dtype=np.float64)
+    mbrs[:count] = node.mbrs
+    children = np.zeros(max_entries, dtype=np.int64)
+    children[:count] = node.children
+    return NODE_HEADER.pack(1 if node.leaf else 0, count) + mbrs.tobytes() + children.tobytes()
+
+
+def _rect_row(rect):
+    return (rect.xmin, rect.ymin, rect.xmax, rect.ymax)
+
+
+def _least_enlargement(m, rect):
+    area = (m[:, 2] - m[:, 0]) * (m[:, 3] - m[:, 1])
+    enlarged = ((np.maximum(m[:, 2], rect.xmax) - np.minimum(m[:, 0], rect.xmin)) *
+                (np.maximum(m[:, 3], rect.ymax) - np.minimum(m[:, 1], rect.ymin)))
+    return int(np.lexsort((area, enlarged - area))[0])
@@ -0,0 +1,59 @@
+from collections import OrderedDict
+
+# Buffer pool LRU genérico para estructuras paginadas en disco.
+# Guarda páginas ya decodificadas (objetos Python) indexadas por número de página;
+# `loader(page_id)` se invoca solo en los fallos de caché.
+
+
+class BufferPool:
+    def __init__(self, capacity, loader):
+        if capacity < 1:
+            raise ValueError("capacity debe ser >= 1")
+        self.capacity = capacity
+        self.loader = loader
+        self._pages = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, page_id):
+        page = self._pages.get(page_id)
+        if page is not None:
+            self._pages.move_to_end(page_id)
+            self.hits += 1
+            return page
+        self.misses += 1
+        page = self.loader(page_id)
+        self.put(page_id, page)
+        return page
+
+    def put(self, page_id, page):
+        """Registra (o reemplaza) una página como la más recientemente usada."""
+        self._pages[page_id] = page
+        self._pages.move_to_end(page_id)
+        while len(self._pages) > self.capacity:
+            self._pages.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._pages.clear()
+
+    def reset_stats(self):
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'capacity': self.capacity,
+            'cached': len(self._pages),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': (self.hits / total) if total > 0 else 0.0
+        }
+
+    def __contains__(self, page_id):
+        return page_id in self._pages
+
+    def __len__(self):
+        return len(self._pages)
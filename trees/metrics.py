@@ -5,8 +5,12 @@ import gc
 from statistics import mean
 
 from .Grid_file import GridFile
+from .KD_tree import AdaptiveKDTree
+from .Quad_tree import QuadTree
 from .R_tree import RTree
+from Nodes.R_tree.Point import Point
 from Nodes.R_tree.Rectangle_R import Rectangle
+from Nodes.Rectangle_Q import Rectangle_Q
 
 
 def _get_rtree_leaf_stats(root):
@@ -28,7 +32,9 @@ def _get_rtree_leaf_stats(root):
 
 def benchmark_gridfile(sizes, capacity=4):
     """Inserta puntos aleatorios y devuelve métricas para cada tamaño.
-    Retorna dict con listas: sizes, times, mem_peaks, load_factors, avg_occupancies, num_cells
+    Retorna dict con listas: sizes, times, mem_peaks, load_factors, avg_occupancies, num_cells, num_buckets
+    (varias celdas del directorio pueden compartir bucket; el factor de carga se mide por bucket).
+    Las claves bulk_* miden GridFile.from_points (escalas por cuantiles) sobre los mismos puntos.
     """
     sizes = list(sizes)
     times = []
@@ -36,16 +42,22 @@ def benchmark_gridfile(sizes, capacity=4):
     load_factors = []
     avg_occupancies = []
     num_cells = []
+    num_buckets = []
+    bulk_times = []
+    bulk_mem_peaks = []
+    bulk_load_factors = []
+    bulk_num_buckets = []
 
     for n in sizes:
+        xs = [random.random() for _ in range(n)]
+        ys = [random.random() for _ in range(n)]
+
         gc.collect()
         tracemalloc.start()
         start = time.perf_counter()
 
         gf = GridFile(capacity=capacity)
-        for _ in range(n):
-            x = random.random()
-            y = random.random()
+        for x, y in zip(xs, ys):
             gf.insert(x, y)
 
         elapsed = time.perf_counter() - start
@@ -53,7 +65,7 @@ def benchmark_gridfile(sizes, capacity=4):
         tracemalloc.stop()
 
         # load factor: avg occupancy / capacity
-        total_buckets = len(gf.directory)
+        total_buckets = len(gf.buckets)
         avg_occ = (n / total_buckets) if total_buckets > 0 else 0
         lf = avg_occ / capacity if capacity > 0 else 0
 
@@ -61,7 +73,27 @@ def benchmark_gridfile(sizes, capacity=4):
         mem_peaks.append(peak)
         load_factors.append(lf)
         avg_occupancies.append(avg_occ)
-        num_cells.append(total_buckets)
+        num_cells.append(int(gf.directory.size))
+        num_buckets.append(total_buckets)
+
+        # misma carga construida en bloque
+        gc.collect()
+        tracemalloc.start()
+        start = time.perf_counter()
+
+        bulk_gf = GridFile.from_points(xs, ys, capacity=capacity)
+
+        elapsed = time.perf_counter() - start
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        total_buckets = len(bulk_gf.buckets)
+        avg_occ = (n / total_buckets) if total_buckets > 0 else 0
+
+        bulk_times.append(elapsed)
+        bulk_mem_peaks.append(peak)
+        bulk_load_factors.append(avg_occ / capacity if capacity > 0 else 0)
+        bulk_num_buckets.append(total_buckets)
 
     return {
         'sizes': sizes,
@@ -69,13 +101,20 @@ def benchmark_gridfile(sizes, capacity=4):
         'mem_peaks': mem_peaks,
         'load_factors': load_factors,
         'avg_occupancies': avg_occupancies,
-        'num_cells': num_cells
+        'num_cells': num_cells,
+        'num_buckets': num_buckets,
+        'bulk_times': bulk_times,
+        'bulk_mem_peaks': bulk_mem_peaks,
+        'bulk_load_factors': bulk_load_factors,
+        'bulk_num_buckets': bulk_num_buckets
     }
 
 
-def benchmark_rtree(sizes, max_entries=4, rect_size=0.001, center=(6.24, -75.58)):
+def benchmark_rtree(sizes, max_entries=4, rect_size=0.001, center=(6.24, -75.58), policy='linear', layout='list'):
     """Inserta rectángulos pequeños alrededor del centro y devuelve métricas.
-    Retorna dict con sizes, times, mem_peaks, load_factors, avg_entries_per_leaf, num_leaves
+    Retorna dict con sizes, times, mem_peaks, load_factors, avg_entries_per_leaf, num_leaves.
+    Las claves bulk_* miden la construcción con RTree.bulk_load (STR) sobre los mismos datos,
+    para comparar carga masiva frente a inserción incremental.
     """
     sizes = list(sizes)
     times = []
@@ -83,20 +122,28 @@ def benchmark_rtree(sizes, max_entries=4, rect_size=0.001, center=(6.24, -75.58)
     load_factors = []
     avg_entries = []
     num_leaves_list = []
+    bulk_times = []
+    bulk_mem_peaks = []
+    bulk_load_factors = []
+    bulk_num_leaves = []
 
     for n in sizes:
-        gc.collect()
-        tracemalloc.start()
-        start = time.perf_counter()
-
-        tree = RTree(max_entries=max_entries)
         cx, cy = center
+        entries = []
         for i in range(n):
             # distribuir aleatoriamente alrededor del centro
             lon = cx + (random.random() - 0.5) * 0.1
             lat = cy + (random.random() - 0.5) * 0.1
             r = Rectangle(lon, lat, lon + rect_size, lat + rect_size)
             data = {"id": i, "mbr": r}
+            entries.append((r, data))
+
+        gc.collect()
+        tracemalloc.start()
+        start = time.perf_counter()
+
+        tree = RTree(max_entries=max_entries, policy=policy, layout=layout)
+        for r, data in entries:
             tree.insert(r, data)
 
         elapsed = time.perf_counter() - start
@@ -114,13 +161,231 @@ def benchmark_rtree(sizes, max_entries=4, rect_size=0.001, center=(6.24, -75.58)
         avg_entries.append(avg_ent)
         num_leaves_list.append(num_leaves)
 
+        # misma carga con empaquetado STR
+        gc.collect()
+        tracemalloc.start()
+        start = time.perf_counter()
+
+        bulk_tree = RTree.bulk_load(entries, max_entries=max_entries, policy=policy, layout=layout)
+
+        elapsed = time.perf_counter() - start
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        num_leaves, total_entries, leaves = _get_rtree_leaf_stats(bulk_tree.root)
+        avg_ent = (total_entries / num_leaves) if num_leaves > 0 else 0
+
+        bulk_times.append(elapsed)
+        bulk_mem_peaks.append(peak)
+        bulk_load_factors.append(avg_ent / max_entries if max_entries > 0 else 0)
+        bulk_num_leaves.append(num_leaves)
+
     return {
         'sizes': sizes,
         'times': times,
         'mem_peaks': mem_peaks,
         'load_factors': load_factors,
         'avg_entries': avg_entries,
-        'num_leaves': num_leaves_list
+        'num_leaves': num_leaves_list,
+        'bulk_times': bulk_times,
+        'bulk_mem_peaks': bulk_mem_peaks,
+        'bulk_load_factors': bulk_load_factors,
+        'bulk_num_leaves': bulk_num_leaves
+    }
+
+
+def benchmark_kdtree(sizes, center=(6.24, -75.58)):
+    """Inserta puntos uno a uno en el AdaptiveKDTree y devuelve métricas por tamaño.
+    Retorna dict con listas: sizes, times, inserts_per_sec, mem_peaks, heights.
+    Las claves bulk_* miden la construcción de una sola vez (AdaptiveKDTree(points)).
+    """
+    sizes = list(sizes)
+    times = []
+    inserts_per_sec = []
+    mem_peaks = []
+    heights = []
+    bulk_times = []
+    bulk_heights = []
+
+    for n in sizes:
+        cx, cy = center
+        pts = [[cx + (random.random() - 0.5) * 0.1, cy + (random.random() - 0.5) * 0.1] for _ in range(n)]
+
+        gc.collect()
+        tracemalloc.start()
+        start = time.perf_counter()
+
+        tree = AdaptiveKDTree()
+        for p in pts:
+            tree.insert(p)
+
+        elapsed = time.perf_counter() - start
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        times.append(elapsed)
+        inserts_per_sec.append(n / elapsed if elapsed > 0 else 0)
+        mem_peaks.append(peak)
+        heights.append(tree.root.height() if tree.root is not None else 0)
+
+        gc.collect()
+        start = time.perf_counter()
+        bulk_tree = AdaptiveKDTree(pts)
+        bulk_times.append(time.perf_counter() - start)
+        bulk_heights.append(bulk_tree.root.height() if bulk_tree.root is not None else 0)
+
+    return {
+        'sizes': sizes,
+        'times': times,
+        'inserts_per_sec': inserts_per_sec,
+        'mem_peaks': mem_peaks,
+        'heights': heights,
+        'bulk_times': bulk_times,
+        'bulk_heights': bulk_heights
+    }
+
+
+def _count_rtree_visits(root, query_rect):
+    # número de nodos visitados por una búsqueda por rectángulo
+    visits = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        visits += 1
+        if node.leaf:
+            continue
+        for i in node.intersecting(query_rect):
+            stack.append(node.children[i])
+    return visits
+
+
+def benchmark_rtree_policies(n, policies=('linear', 'quadratic', 'rstar'), max_entries=4,
+                             num_queries=200, query_size=0.005, rect_size=0.001, center=(6.24, -75.58),
+                             layouts=('list', 'array')):
+    """Compara las políticas de split/choose-subtree del RTree sobre los mismos datos y consultas,
+    con cada layout de nodo lado a lado.
+    Retorna dict con policies, layouts y, por layout, listas por política: build_times,
+    query_times, avg_visits, avg_results (p. ej. query_times['array'][i]).
+
+    El layout 'array' solo gana en consultas con fan-outs de decenas de entradas
+    (max_entries por encima de SCALAR_MAX de R_array_node); con M chico 'list' es más rápido.
+    """
+    cx, cy = center
+    entries = []
+    for i in range(n):
+        lon = cx + (random.random() - 0.5) * 0.1
+        lat = cy + (random.random() - 0.5) * 0.1
+        r = Rectangle(lon, lat, lon + rect_size, lat + rect_size)
+        entries.append((r, {"id": i, "mbr": r}))
+
+    queries = []
+    for _ in range(num_queries):
+        qx = cx + (random.random() - 0.5) * 0.1
+        qy = cy + (random.random() - 0.5) * 0.1
+        queries.append(Rectangle(qx, qy, qx + query_size, qy + query_size))
+
+    policies = list(policies)
+    layouts = list(layouts)
+    build_times = {layout: [] for layout in layouts}
+    query_times = {layout: [] for layout in layouts}
+    avg_visits = {layout: [] for layout in layouts}
+    avg_results = {layout: [] for layout in layouts}
+
+    for policy in policies:
+        for layout in layouts:
+            gc.collect()
+            start = time.perf_counter()
+            tree = RTree(max_entries=max_entries, policy=policy, layout=layout)
+            for r, data in entries:
+                tree.insert(r, data)
+            build_times[layout].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            found = [len(tree.search(q)) for q in queries]
+            query_times[layout].append((time.perf_counter() - start) / len(queries) if queries else 0)
+
+            visits = [_count_rtree_visits(tree.root, q) for q in queries]
+            avg_visits[layout].append(mean(visits) if visits else 0)
+            avg_results[layout].append(mean(found) if found else 0)
+
+    return {
+        'policies': policies,
+        'layouts': layouts,
+        'build_times': build_times,
+        'query_times': query_times,
+        'avg_visits': avg_visits,
+        'avg_results': avg_results
+    }
+
+
+def benchmark_knn(n, k=1, num_queries=200, capacity=4, max_entries=4, center=(6.24, -75.58), spread=0.1):
+    """Misma carga kNN (k vecinos de num_queries puntos al azar) sobre las cuatro estructuras,
+    construidas con los mismos n puntos.
+    Retorna dict con listas por estructura: structures, build_times, query_times (media por consulta).
+    kd_batch_query_time es la media por consulta del KD-Tree respondiendo todas en un solo lote.
+    """
+    cx, cy = center
+    pts = [(cx + (random.random() - 0.5) * spread, cy + (random.random() - 0.5) * spread) for _ in range(n)]
+    queries = [(cx + (random.random() - 0.5) * spread, cy + (random.random() - 0.5) * spread)
+               for _ in range(num_queries)]
+
+    def build_gridfile():
+        gf = GridFile(capacity=capacity)
+        for x, y in pts:
+            gf.insert(x, y)
+        return gf
+
+    def build_rtree():
+        return RTree.bulk_load([(Rectangle(x, y, x, y), i) for i, (x, y) in enumerate(pts)],
+                               max_entries=max_entries)
+
+    def build_kdtree():
+        tree = AdaptiveKDTree([list(p) for p in pts])
+        tree.query([pts[0]], k)   # prepara la instantánea estática de las consultas
+        return tree
+
+    def build_quadtree():
+        qt = QuadTree(Rectangle_Q(cx, cy, spread / 2, spread / 2), capacity=capacity)
+        for x, y in pts:
+            qt.insert(Point(x, y))
+        return qt
+
+    structures = {
+        'GridFile': (build_gridfile, lambda s, x, y: s.nearest(x, y, k)),
+        'RTree': (build_rtree, lambda s, x, y: s.nearest(x, y, k)),
+        # query devuelve (idx, dists), arreglos (1, k)
+        'KD-Tree': (build_kdtree, lambda s, x, y: s.query([(x, y)], k)),
+        'QuadTree': (build_quadtree, lambda s, x, y: s.nearest(x, y, k)),
+    }
+
+    build_times = []
+    query_times = []
+    kd_batch_query_time = None
+    for name, (build, query) in structures.items():
+        gc.collect()
+        start = time.perf_counter()
+        structure = build()
+        build_times.append(time.perf_counter() - start)
+
+        if not queries:
+            query_times.append(None)
+            continue
+        start = time.perf_counter()
+        for x, y in queries:
+            query(structure, x, y)
+        query_times.append((time.perf_counter() - start) / len(queries))
+
+        if name == 'KD-Tree':
+            start = time.perf_counter()
+            structure.query(queries, k)
+            kd_batch_query_time = (time.perf_counter() - start) / len(queries)
+
+    return {
+        'structures': list(structures),
+        'k': k,
+        'build_times': build_times,
+        'query_times': query_times,
+        'kd_batch_query_time': kd_batch_query_time
     }
 
 
@@ -132,20 +397,13 @@ def analyze_gridfile_instance(gf: GridFile):
     start = time.perf_counter()
 
     # computar número total de puntos
-    total_points = 0
-    for bucket in gf.directory.values():
-        # Bucket.points es la lista de puntos
-        try:
-            total_points += len(bucket.points)
-        except Exception:
-            # estructura inesperada
-            pass
+    total_points = gf.num_points()
 
     elapsed = time.perf_counter() - start
     current, peak = tracemalloc.get_traced_memory()
     tracemalloc.stop()
 
-    total_buckets = len(gf.directory)
+    total_buckets = len(gf.buckets)
     avg_occ = (total_points / total_buckets) if total_buckets > 0 else 0
     lf = avg_occ / gf.capacity if getattr(gf, 'capacity', 1) > 0 else 0
 
@@ -155,7 +413,8 @@ def analyze_gridfile_instance(gf: GridFile):
         'mem_peaks': [peak],
         'load_factors': [lf],
         'avg_occupancies': [avg_occ],
-        'num_cells': [total_buckets]
+        'num_cells': [int(gf.directory.size)],
+        'num_buckets': [total_buckets]
     }
 
 